@@ -4,6 +4,8 @@ const { Schema } = mongoose;
 const medicineDetailsSchema = new Schema(
   {
     name: { type: String, required: true, index: true },
+    // Lower-cased name with whitespace/punctuation folded, for exact lookups
+    name_key: { type: String, index: true },
     description: String,
     use0: String, use1: String, use2: String, use3: String, use4: String,
     dosage: String,
@@ -29,4 +31,25 @@ const medicineDetailsSchema = new Schema(
   { timestamps: true }
 );
 
+// Keep in step with name_key() in src/Chatbot/medicine_catalogue.py
+const nameKey = (name) =>
+  String(name || "").toLowerCase().replace(/[^\p{L}\p{N}]+/gu, " ").trim();
+
+// "validate" runs for save() and for every document of insertMany()
+medicineDetailsSchema.pre("validate", function (next) {
+  if (this.isModified("name") || this.name_key === undefined) {
+    this.name_key = nameKey(this.name);
+  }
+  next();
+});
+
+medicineDetailsSchema.pre(["updateOne", "updateMany", "findOneAndUpdate"], function (next) {
+  const update = this.getUpdate() || {};
+  const name = update.$set && update.$set.name !== undefined ? update.$set.name : update.name;
+  if (name !== undefined) {
+    this.set("name_key", nameKey(name));
+  }
+  next();
+});
+
 module.exports = mongoose.model("MedicineDetails", medicineDetailsSchema, "medicines");
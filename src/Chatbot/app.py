@@ -1,25 +1,27 @@
 import os
-from datetime import datetime
-import spacy
-from spacy.matcher import PhraseMatcher
-from flask import Flask, request, jsonify
+import hmac
+import json
+import threading
+from datetime import datetime, timezone
+from flask import Flask, Response, request, jsonify, g, stream_with_context
 from flask_cors import CORS
 from flask_pymongo import PyMongo
-import nltk
-from fuzzywuzzy import process, fuzz
+from pymongo import ReturnDocument
+from fuzzywuzzy import fuzz
 import re
 from bson.objectid import ObjectId, InvalidId
-
-# ----------------- NLTK SETUP -----------------
-try:
-    nltk.data.find("tokenizers/punkt")
-except LookupError:
-    nltk.download("punkt", quiet=True)
-
-try:
-    nltk.data.find("tokenizers/punkt_tab")
-except LookupError:
-    nltk.download("punkt_tab", quiet=True)
+from chat_metrics import ChatMetrics
+from keyword_automaton import KeywordAutomaton, PhraseCounts
+from medicine_catalogue import CatalogueCache, DetailsCache, PROJECTION, backfill_name_keys, name_key
+from mongo_indexes import IndexBootstrap
+from mongo_profiler import MongoProfiler
+from name_matcher import NameMatcher
+from parsed_message import ParsedMessage
+from recommendation_cache import RecommendationCache
+from session_store import SessionStore, SessionWrites
+from symptom_index import USE_FIELDS, SymptomIndex, medicine_uses, partial_ratios
+from transcript_writer import TranscriptWriter
+from warm_up import WarmUp
 
 # ----------------- FLASK APP -----------------
 app = Flask(__name__)
@@ -29,124 +31,390 @@ FRONTEND_URLS = [
     "https://mediquick-pqv7.onrender.com",
 ]
 
+# ---------- METRICS ----------
+# Stage timings, Mongo operation counts and /metrics; off adds no overhead
+CHAT_METRICS = os.environ.get("CHAT_METRICS", "0") == "1"
+metrics = ChatMetrics(enabled=CHAT_METRICS)
+
+if CHAT_METRICS:
+    @app.before_request
+    def begin_request_metrics():
+        g.metrics_token = metrics.begin(request.endpoint or "unmatched")
+
+    # Registered first so it runs last, after the session write
+    @app.teardown_request
+    def end_request_metrics(exc):
+        metrics.end(g.pop("metrics_token", None))
+
+# ---------- MONGO PROFILER ----------
+# Debug aid: every Mongo command a request sends, repeats and N+1 loops flagged
+MONGO_PROFILE = os.environ.get("MONGO_PROFILE", os.environ.get("FLASK_DEBUG", "0")) == "1"
+profiler = MongoProfiler(
+    enabled=MONGO_PROFILE,
+    repeat=int(os.environ.get("MONGO_PROFILE_REPEAT", "2")),
+    keep=int(os.environ.get("MONGO_PROFILE_KEEP", "100")),
+    server_timing=os.environ.get("MONGO_PROFILE_SERVER_TIMING", "0") == "1",
+)
+
+if MONGO_PROFILE:
+    @app.before_request
+    def begin_mongo_profile():
+        g.mongo_profile_token = profiler.begin(request.endpoint or "unmatched", request.method, request.path)
+
+    # Also registered before the session write, so its commands are profiled
+    @app.teardown_request
+    def end_mongo_profile(exc):
+        profiler.end(g.pop("mongo_profile_token", None))
+
+if profiler.server_timing:
+    @app.after_request
+    def add_server_timing(response):
+        # Sent before teardown: the session write is in the profile, not the header
+        profile = profiler.current()
+        if profile is not None:
+            stats = metrics.current()
+            response.headers["Server-Timing"] = profiler.timing_header(profile, stats.spans if stats else ())
+        return response
+
 # ---------- MONGO CONFIG ----------
 MONGO_URI = os.environ.get("MONGO_URI")
 if not MONGO_URI:
     print("WARNING: MONGO_URI environment variable is not set.")
 
 app.config["MONGO_URI"] = MONGO_URI
-mongo = PyMongo(app)
+mongo = PyMongo(app, event_listeners=metrics.event_listeners() + profiler.event_listeners())
 
 CORS(app, origins=FRONTEND_URLS)
 
-nlp = spacy.blank("en")
+# ---------- CATALOGUE CACHE ----------
+# "change_stream" (falls back to polling), "poll" or "off"
+CATALOGUE_REFRESH = os.environ.get("CATALOGUE_REFRESH", "change_stream")
+CATALOGUE_POLL_SECONDS = float(os.environ.get("CATALOGUE_POLL_SECONDS", "60"))
+
+medicine_details = DetailsCache(
+    lambda: mongo.db.medicines,
+    max_size=int(os.environ.get("MEDICINE_DETAILS_CACHE_SIZE", "256")),
+)
+
+catalogue = CatalogueCache(
+    loader=lambda: mongo.db.medicines.find({}, PROJECTION),
+    watcher=lambda: mongo.db.medicines.watch(),
+    mode=CATALOGUE_REFRESH,
+    poll_interval=CATALOGUE_POLL_SECONDS,
+    details_loader=medicine_details,
+)
+
+# ---------- WARM-UP ----------
+def load_catalogue():
+    """Load the catalogue; its listeners build the matchers and symptom index."""
+    catalogue.get()
+
+def ensure_indexes():
+    # Indexes the server refused stay failed in /health; retrying won't help
+    if not index_bootstrap.run() and index_bootstrap.retryable():
+        raise RuntimeError("some indexes could not be created")
+
+# Retried in the background until they succeed; nothing remote runs at import
+warm_up = WarmUp(
+    [
+        ("catalogue", load_catalogue),
+        ("name_keys", lambda: backfill_medicine_name_keys()),
+        ("indexes", ensure_indexes),
+    ],
+    required=["catalogue", "matcher", "name_matcher", "symptom_index"],
+    retry_initial=float(os.environ.get("WARM_UP_RETRY_SECONDS", "1")),
+    retry_max=float(os.environ.get("WARM_UP_RETRY_MAX_SECONDS", "30")),
+)
+
+catalogue.subscribe(lambda snapshot: warm_up.loaded("catalogue", snapshot.version))
 
 # ----------------- GLOBAL CACHE -----------------
-matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
+# Checked in this order; the first intent with a keyword in the message wins
+INTENT_KEYWORDS = {
+    "ADD_TO_CART": ["add", "buy", "cart", "purchase"],
+    "PRICE": ["price", "cost", "mrp"],
+    "DOSAGE": ["dosage", "dose", "how much"],
+    "SIDE_EFFECTS": ["side effect", "effects", "reaction"],
+    "PRECAUTIONS": ["precaution", "safe"],
+    "DELIVERY": ["delivery"],
+    "MEDICINE_OVERVIEW": ["tell me", "about", "what is", "information", "details"],
+    "SYMPTOMS": ["fever", "pain", "cold", "cough", "headache", "have", "suffering"],
+}
+ALLERGY_KEYWORDS = ["allergic", "allergy", "rash", "reaction", "hives", "itching"]
+
+# Intent and allergy keywords, plus the catalogue's use phrases once loaded
+keyword_automaton = KeywordAutomaton(dict(INTENT_KEYWORDS, ALLERGY=ALLERGY_KEYWORDS))
+
+# Use phrases per medicine, so a new version only touches what changed
+use_phrases = PhraseCounts()
+matcher_lock = threading.Lock()
 
-def initialize_matcher():
-    """Load medical patterns from DB once on startup."""
+def initialize_matcher(snapshot):
+    """Bring the medical use phrases up to date with every catalogue version.
+
+    The first version compiles them all; later ones add and remove just the
+    phrases of medicines whose uses changed.
+    """
     try:
-        print("Loading medical patterns...")
-        all_use_phrases = set()
-        if mongo.db is not None:
-            for med in mongo.db.medicines.find():
-                for i in range(5):
-                    use = med.get(f"use{i}")
-                    if use:
-                        all_use_phrases.add(use.lower())
-        
-        if all_use_phrases:
-            patterns = [nlp.make_doc(phrase) for phrase in all_use_phrases]
-            matcher.add("MED_USE", patterns)
-            print(f"Patterns loaded: {len(patterns)} phrases.")
-            
+        with matcher_lock:
+            current = keyword_automaton.version
+            if current is not None and snapshot.version <= current:
+                return
+            added, removed = use_phrases.diff({
+                str(med.get("_id", i)): tuple(map(med.get, USE_FIELDS))
+                for i, med in enumerate(snapshot.medicines)
+            })
+            if current is None:
+                keyword_automaton.build(use_phrases.counts, version=snapshot.version)
+            else:
+                keyword_automaton.update(added, removed, version=snapshot.version)
+        warm_up.loaded("matcher", snapshot.version)
+        change = keyword_automaton.last_change
+        print(
+            f"Patterns loaded: {len(keyword_automaton)} phrases "
+            f"(+{len(added)} -{len(removed)}, {change['kind']} in {change['seconds'] * 1e3:.1f} ms)."
+        )
     except Exception as e:
         print(f"Error initializing matcher: {e}")
 
-# Call this immediately
-with app.app_context():
+catalogue.subscribe(initialize_matcher)
+
+symptom_index = SymptomIndex()
+
+def initialize_symptom_index(snapshot=None):
+    """(Re)build the symptom index from in-stock medicines.
+
+    Also the refresh hook: the catalogue cache calls it with every new version.
+    """
+    try:
+        if mongo.db is not None:
+            snapshot = snapshot or catalogue.get()
+            count = symptom_index.build(snapshot.medicines)
+            warm_up.loaded("symptom_index", snapshot.version)
+            print(f"Symptom index built: {count} medicines (catalogue v{snapshot.version}).")
+    except Exception as e:
+        print(f"Error building symptom index: {e}")
+
+catalogue.subscribe(initialize_symptom_index)
+
+name_matcher = NameMatcher()
+
+def initialize_name_matcher(snapshot):
+    """Precompile medicine names for mention detection on every catalogue version."""
+    name_matcher.build(snapshot.names)
+    warm_up.loaded("name_matcher", snapshot.version)
+    print(f"Name matcher built: {len(name_matcher)} names.")
+
+catalogue.subscribe(initialize_name_matcher)
+
+def match_medicine_names(message, limit):
+    """Medicine names mentioned in ``message`` with a fuzzy score above 80."""
+    # Loads the catalogue (and so the matcher) if that failed at startup
+    catalogue.get()
+    return name_matcher.extract(message, limit=limit)
+
+# ---------- INDEXES ----------
+index_bootstrap = IndexBootstrap(lambda: mongo.db)
+
+def backfill_medicine_name_keys():
+    """Set ``name_key`` on medicines saved before the field existed."""
+    updated = backfill_name_keys(mongo.db.medicines)
+    print(f"Medicine name keys ready ({updated} backfilled).")
+
+@app.cli.command("ensure-indexes")
+def ensure_indexes_command():
+    """Backfill name keys and create the indexes the chatbot relies on."""
+    try:
+        backfill_medicine_name_keys()
+        ok = True
+    except Exception as e:
+        print(f"Error backfilling medicine name keys: {e}")
+        ok = False
+    ok = index_bootstrap.run() and ok
+    for name, entry in index_bootstrap.stats()["indexes"].items():
+        print(f"{name}: {entry['state']}" + (f" ({entry['error']})" if entry.get("error") else ""))
+    if not ok:
+        raise SystemExit(1)
+
+@app.before_request
+def start_warm_up():
+    # Workers forked from a preloaded app start their own (once per process)
     if MONGO_URI:
-        initialize_matcher()
+        warm_up.start()
+
+if MONGO_URI:
+    warm_up.start()
 
 # ---------- DYNAMIC SYMPTOM EXTRACTION ----------
-def extract_symptoms_from_text(text):
+def parse_message(text):
+    return ParsedMessage(text, keyword_automaton)
+
+@metrics.timed("extract_symptoms")
+def extract_symptoms_from_text(parsed):
     """
     Extracts symptoms using both DB patterns AND the broad regex 
     that was working in your original code.
     """
     # 1. Exact phrase matching from DB
-    doc = nlp(text.lower())
-    matches = matcher(doc)
-    matched_symptoms = [doc[start:end].text for match_id, start, end in matches]
+    matched_symptoms = parsed.phrases
     
     # 2. Broad Regex Fallback
-    tokens = nltk.word_tokenize(text.lower())
-    regex_symptoms = [w for w in tokens if re.match(r'^[a-z]{3,15}$', w) and len(w) > 2]
+    regex_symptoms = parsed.words
     
     # Combine results
     return list(set(matched_symptoms + regex_symptoms))[:10]
 
 # ---------- NLP UTILITIES ----------
-def tokenize(text):
-    words = nltk.word_tokenize(text.lower())
-    return [w for w in words if w.isalnum()]
-
-def detect_intent(message):
-    msg = message.lower()
-    if any(x in msg for x in ["add", "buy", "cart", "purchase"]):
-        return "ADD_TO_CART"
-    if any(x in msg for x in ["price", "cost", "mrp"]):
-        return "PRICE"
-    if any(x in msg for x in ["dosage", "dose", "how much"]):
-        return "DOSAGE"
-    if any(x in msg for x in ["side effect", "effects", "reaction"]):
-        return "SIDE_EFFECTS"
-    if any(x in msg for x in ["precaution", "safe"]):
-        return "PRECAUTIONS"
-    if any(x in msg for x in ["delivery"]):
-        return "DELIVERY"
-    if any(x in msg for x in ["tell me", "about", "what is", "information", "details"]):
-        return "MEDICINE_OVERVIEW"
-    if any(x in msg for x in ["fever", "pain", "cold", "cough", "headache", "have", "suffering"]):
-        return "SYMPTOMS"
+def tokenize(parsed):
+    return [w for w in parsed.tokens if w.isalnum()]
+
+@metrics.timed("detect_intent")
+def detect_intent(parsed):
+    for intent in INTENT_KEYWORDS:
+        if intent in parsed.keywords:
+            return intent
     return "UNKNOWN"
 
 # ---------- SESSION UTILITIES ----------
-def get_session_id():
-    explicit = request.headers.get("X-Session-Id")
+def get_session_id(headers=None):
+    """Session of the current request (or of ``headers``, for the ASGI app)."""
+    if headers is None:
+        headers = request.headers
+    explicit = headers.get("X-Session-Id")
     if explicit:
         return explicit
     
     # Handle React Frontend Header
-    auth_token = request.headers.get("auth-token")
+    auth_token = headers.get("auth-token")
     if auth_token:
         return auth_token
         
-    auth_header = request.headers.get("Authorization")
+    auth_header = headers.get("Authorization")
     if auth_header and auth_header.startswith("Bearer "):
         return auth_header.split(" ")[1]
     return "anonymous"
 
+def new_session(session_id):
+    return {
+        "session_id": session_id,
+        "last_mentioned_medicine": None,
+        "awaiting_cart_confirmation": False,
+        "last_medicines_for_cart": [],
+        "cart": [], # Explicitly storing cart in DB
+    }
+
+def session_defaults(session_id):
+    """``$setOnInsert`` fields for a session created by an upsert."""
+    return {k: v for k, v in new_session(session_id).items() if k != "session_id"}
+
+# "Write-behind" hands each request's session writes to a background flusher
+SESSION_WRITE_BEHIND = os.environ.get("SESSION_WRITE_BEHIND", "0") == "1"
+
+# The session cache is per process, so it is off unless requests for a
+# session always reach the same worker (one worker, or sticky routing):
+# otherwise a worker could answer "two" from a cached copy that missed the
+# "add to cart" another worker just handled
+session_store = SessionStore(
+    lambda: mongo.db.sessions,
+    new_session,
+    max_size=int(os.environ.get("SESSION_CACHE_SIZE", "0")),
+    ttl=float(os.environ.get("SESSION_CACHE_TTL", "60")),
+    write_behind=SESSION_WRITE_BEHIND,
+    flush_interval=float(os.environ.get("SESSION_FLUSH_SECONDS", "0.5")),
+)
+
+def session_writes():
+    """Session reads/updates of the current request, written once at its end."""
+    writes = g.get("session_writes")
+    if writes is None:
+        writes = g.session_writes = SessionWrites()
+    return writes
+
 def get_or_create_session(session_id):
-    session = mongo.db.sessions.find_one({"session_id": session_id})
-    if not session:
-        session = {
-            "session_id": session_id,
-            "last_mentioned_medicine": None,
-            "awaiting_cart_confirmation": False,
-            "last_medicines_for_cart": [],
-            "cart": [], # Explicitly storing cart in DB
-        }
-        mongo.db.sessions.insert_one(session)
-    return session
+    return session_store.get(session_id, session_writes())
 
 def update_session(session_id, updates):
-    mongo.db.sessions.update_one(
-        {"session_id": session_id},
-        {"$set": updates},
-        upsert=True,
-    )
+    session_store.update(session_id, updates, session_writes())
+
+def commit_session_writes():
+    """Write the request's session updates; raises if the write fails."""
+    writes = g.pop("session_writes", None)
+    if writes is not None:
+        session_store.commit(writes)
+
+@app.after_request
+def commit_session_writes_before_response(response):
+    # A failed write turns the response into a 500 instead of a lost update;
+    # streamed replies commit before their last frame
+    if not response.is_streamed:
+        commit_session_writes()
+    return response
+
+@app.teardown_request
+def commit_leftover_session_writes(exc):
+    # Also runs as a streamed view returns, before its frames are produced
+    if g.get("session_writes_streamed"):
+        return
+    # Too late to change the response; the store has counted and printed it
+    try:
+        commit_session_writes()
+    except Exception:
+        pass
+
+# A conflicting add retries the $inc/$push pair this many times
+CART_UPDATE_ATTEMPTS = 5
+
+def update_cart(session_id, query, update):
+    """Apply one atomic update to the session's cart.
+
+    Returns the cart after the update, or None if no session matched.
+    """
+    query = dict(query, session_id=session_id)
+    session = mongo.db.sessions.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+    if session is None:
+        return None
+    # Keep the session cache in step with what Mongo now holds
+    return session_store.refresh(session, session_writes()).get("cart", [])
+
+def cart_item_match(medicine_id):
+    """Cart line item with this medicine id (or name, from the chatbot)."""
+    return {"$or": [{"medicineId": medicine_id}, {"name": medicine_id}]}
+
+def cart_item_details(med):
+    """``(price, medicine_id)`` of a cart item for catalogue entry ``med``."""
+    if not med:
+        return 0, "unknown"
+
+    # FIX: Prefer 'priceNumeric' to avoid NaN in frontend
+    price = med.get('priceNumeric') if med.get('priceNumeric') else med.get('price')
+    
+    # Fallback: if price is still a string like "₹20", strip it
+    if isinstance(price, str):
+        try:
+            price = float(re.sub(r'[^\d.]', '', price))
+        except:
+            price = 0
+    
+    return price, str(med.get('_id'))
+
+def cart_add_updates(item_name, quantity, price, medicine_id):
+    """The two atomic updates ``add_item_to_cart`` tries, in order, as
+    ``(query, update)`` pairs: bump the quantity of the item already in the
+    cart, or append it if it isn't there."""
+    name_pattern = re.compile(f"^{re.escape(item_name)}$", re.IGNORECASE)
+    new_item = {
+        "medicineId": medicine_id, 
+        "name": item_name, 
+        "quantity": quantity, 
+        "price": price,
+        # Add image fallback for frontend
+        "imageUrl": "https://cdn-icons-png.flaticon.com/512/883/883407.png" 
+    }
+    return [
+        ({"cart": {"$elemMatch": {"name": name_pattern}}}, {"$inc": {"cart.$.quantity": quantity}}),
+        # Unless a concurrent request just added it
+        ({"cart": {"$not": {"$elemMatch": {"name": name_pattern}}}}, {"$push": {"cart": new_item}}),
+    ]
 
 # FIX: Added medicine_id=None to parameters to prevent TypeError
 def add_item_to_cart(session_id, item_name, quantity, price=None, medicine_id=None):
@@ -154,135 +422,176 @@ def add_item_to_cart(session_id, item_name, quantity, price=None, medicine_id=No
     
     # 1. Fetch details if missing (Price should be Numeric for calculation)
     if not price or not medicine_id:
-        med = mongo.db.medicines.find_one({"name": {"$regex": f"^{item_name}$", "$options": "i"}})
-        if med:
-            # FIX: Prefer 'priceNumeric' to avoid NaN in frontend
-            price = med.get('priceNumeric') if med.get('priceNumeric') else med.get('price')
-            
-            # Fallback: if price is still a string like "₹20", strip it
-            if isinstance(price, str):
-                try:
-                    price = float(re.sub(r'[^\d.]', '', price))
-                except:
-                    price = 0
-            
-            medicine_id = str(med.get('_id'))
-        else:
-            price = 0
-            medicine_id = "unknown"
+        med = catalogue_medicine(item_name) or find_medicine_by_name(item_name)
+        price, medicine_id = cart_item_details(med)
 
-    session = get_or_create_session(session_id)
-    cart = session.get("cart", [])
-    
-    # 2. Check if item exists, update quantity if so
-    found = False
-    for item in cart:
-        if item["name"].lower() == item_name.lower():
-            item["quantity"] += quantity
-            found = True
-            break
-    
-    # 3. Add new item
-    if not found:
-        cart.append({
-            "medicineId": medicine_id, 
-            "name": item_name, 
-            "quantity": quantity, 
-            "price": price,
-            # Add image fallback for frontend
-            "imageUrl": "https://cdn-icons-png.flaticon.com/512/883/883407.png" 
-        })
-        
-    update_session(session_id, {"cart": cart})
-    return cart
+    # 2. Bump the quantity if the item is already in the cart, else append it.
+    # Each step is one atomic update, so concurrent requests can't lose items.
+    updates = cart_add_updates(item_name, quantity, price, medicine_id)
+    for _ in range(CART_UPDATE_ATTEMPTS):
+        for query, update in updates:
+            cart = update_cart(session_id, query, update)
+            if cart is not None:
+                return cart
+
+        # No session document yet
+        mongo.db.sessions.update_one(
+            {"session_id": session_id},
+            {"$setOnInsert": session_defaults(session_id)},
+            upsert=True,
+        )
+    raise RuntimeError(f"Cart update for {item_name} kept conflicting, giving up")
 
 # ---------- CHAT LOGGING ----------
+# "async" queues turns for bulk inserts; "sync" keeps strict per-turn writes (audit)
+CHAT_LOG_MODE = os.environ.get("CHAT_LOG_MODE", "async")
+
+transcripts = TranscriptWriter(
+    lambda: mongo.db.chats,
+    mode=CHAT_LOG_MODE,
+    batch_size=int(os.environ.get("CHAT_LOG_BATCH_SIZE", "100")),
+    flush_interval=float(os.environ.get("CHAT_LOG_FLUSH_SECONDS", "1")),
+    max_queue=int(os.environ.get("CHAT_LOG_QUEUE_SIZE", "10000")),
+)
+
+@metrics.timed("save_chat_turn")
 def save_chat_turn(session_id, user_message, bot_message, medicines=None, quantities=None):
-    mongo.db.chats.insert_one({
+    turn = {
         "session_id": session_id,
         "user_message": user_message,
         "bot_message": bot_message,
         "medicines": medicines or [],
         "quantities": quantities or {},
         "timestamp": datetime.utcnow(),
-    })
+    }
+    buffered = g.get("chat_turns")
+    if buffered is not None:
+        buffered.append(turn)
+        return
+    transcripts.write(turn)
 
 # ---------- SMART MEDICINE MATCHING ----------
-def calculate_relevance(symptom, med_uses):
-    score = 0
-    all_uses = ' '.join(med_uses).lower()
-    
-    # Exact match
-    if symptom in all_uses:
-        score += 100
-    
-    # Fuzzy partial match
-    fuzzy_score = fuzz.partial_ratio(symptom, all_uses)
-    if fuzzy_score >= 85:
-        score += fuzzy_score
-    elif fuzzy_score >= 70:
-        score += fuzzy_score * 0.5
-    
-    # Stemmed word match
-    symptom_stem = symptom.rstrip('s') 
-    if symptom_stem in all_uses:
-        score += 60
-    
-    return score
+# Suggestions per reply; clients can ask for 1..RECOMMENDATION_MAX_LIMIT with "k"
+RECOMMENDATION_LIMIT = int(os.environ.get("RECOMMENDATION_LIMIT", "5"))
+RECOMMENDATION_MAX_LIMIT = int(os.environ.get("RECOMMENDATION_MAX_LIMIT", "20"))
+
+def recommendation_limit(value):
+    """Validated ``k`` from a /chat body (``None`` for the default)."""
+    if value is None:
+        return RECOMMENDATION_LIMIT
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError("k must be an integer")
+    k = int(value)
+    if not 1 <= k <= RECOMMENDATION_MAX_LIMIT:
+        raise ValueError(f"k must be between 1 and {RECOMMENDATION_MAX_LIMIT}")
+    return k
+
+# Rankings per symptom set, dropped whenever the symptom index is rebuilt
+recommendations = RecommendationCache(
+    max_size=int(os.environ.get("RECOMMENDATION_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("RECOMMENDATION_CACHE_TTL", "300")),
+)
 
-def find_medicines(symptoms):
+def calculate_relevance(symptom, all_uses_list):
+    """Relevance of ``symptom`` to each medicine in one call.
+
+    ``all_uses_list`` holds each medicine's uses joined and lower-cased, as
+    precomputed by the symptom index.
+    """
+    symptom_stem = symptom.rstrip('s')
+    fuzzy_scores = partial_ratios(symptom, all_uses_list)
+
+    scores = []
+    for all_uses, fuzzy_score in zip(all_uses_list, fuzzy_scores):
+        score = 0
+
+        # Exact match
+        if symptom in all_uses:
+            score += 100
+
+        # Fuzzy partial match
+        if fuzzy_score >= 85:
+            score += fuzzy_score
+        elif fuzzy_score >= 70:
+            score += fuzzy_score * 0.5
+
+        # Stemmed word match
+        if symptom_stem in all_uses:
+            score += 60
+
+        scores.append(score)
+    return scores
+
+@metrics.timed("find_medicines")
+def find_medicines(symptoms, limit=RECOMMENDATION_LIMIT):
     if not symptoms:
         return []
     
-    scored_medicines = []
-    
-    # Use boolean 'in_stock'
-    for med in mongo.db.medicines.find({"in_stock": True}):
-        if med.get("in_stock") is False:
-            continue
-        
-        uses = [med.get(f"use{i}", "") for i in range(5) if med.get(f"use{i}")]
-        if not uses:
-            continue
-        
-        total_score = 0
-        match_count = 0
-        
-        for symptom in symptoms:
-            # Skip common stopwords that might be caught by regex
-            if symptom in ["have", "what", "is", "the", "for", "and"]:
-                continue
+    # Skip common stopwords that might be caught by regex
+    scoring_symptoms = [s for s in symptoms if s not in ["have", "what", "is", "the", "for", "and"]]
 
-            relevance = calculate_relevance(symptom, uses)
-            if relevance > 20: 
-                total_score += relevance
-                match_count += 1
-        
-        if match_count > 0:
-            scored_medicines.append({
-                "name": med["name"],
-                "dosage": med.get("dosage", ""),
-                "price": med.get("price"),
-                "delivery_time": med.get("delivery_time", ""),
-                "availability": "In stock",
-                "score": total_score / match_count,
-                "matched_symptoms": symptoms, # simplified
-                "uses": uses
-            })
-    
-    scored_medicines.sort(key=lambda x: x["score"], reverse=True)
-    
-    # Dedupe by name
-    seen = set()
-    final = []
-    for med in scored_medicines:
-        if med["name"] not in seen:
-            seen.add(med["name"])
-            final.append(med)
-            if len(final) == 5:
-                break
-    
-    return final
+    # Index is normally built at startup; retry here if Mongo was down then
+    if not symptom_index.ready:
+        initialize_symptom_index()
+
+    # Mean relevance per medicine, best first (catalogue order for ties),
+    # one medicine per name; response dicts only for the final ``limit``
+    version = symptom_index.version
+    ranked = recommendations.get(version, scoring_symptoms, limit)
+    if ranked is None:
+        ranked = symptom_index.rank(scoring_symptoms, calculate_relevance, limit=limit)
+        if symptom_index.ready:
+            recommendations.put(version, scoring_symptoms, limit, ranked)
+
+    return [
+        {
+            "name": med["name"],
+            "dosage": med.get("dosage", ""),
+            "price": med.get("price"),
+            "delivery_time": med.get("delivery_time", ""),
+            "availability": "In stock",
+            "score": score,
+            "matched_symptoms": symptoms, # simplified
+            "uses": medicine_uses(med)
+        }
+        for med, score in ranked
+    ]
+
+def name_query(med_name):
+    """Anchored, case-insensitive match on the name, for medicines stored
+    without a ``name_key`` (added since the last backfill)."""
+    return {"name": {"$regex": f"^{re.escape(str(med_name).strip())}$", "$options": "i"}}
+
+def find_medicine_by_name(med_name):
+    """Equality lookup on the indexed ``name_key``, falling back to the
+    fuzzy name matcher for names that aren't an exact catalogue name."""
+    key = name_key(med_name)
+    if not key:
+        return None
+    medicines = mongo.db.medicines
+    med = medicines.find_one({"name_key": key}) or medicines.find_one(name_query(med_name))
+    if med:
+        return med
+
+    match = match_medicine_names(med_name, limit=1)
+    if match and name_key(match[0][0]) != key:
+        name = match[0][0]
+        return medicines.find_one({"name_key": name_key(name)}) or medicines.find_one(name_query(name))
+    return None
+
+def catalogue_medicine(med_name):
+    """``find_medicine_by_name`` on the in-memory catalogue: its
+    MedicineRecord, or None if the current snapshot doesn't have it."""
+    key = name_key(med_name)
+    if not key:
+        return None
+    by_name_key = catalogue.get().by_name_key
+    med = by_name_key.get(key)
+    if med is None:
+        match = match_medicine_names(med_name, limit=1)
+        if match:
+            med = by_name_key.get(name_key(match[0][0]))
+    return med
 
 def build_overview(med):
     uses = [med.get(f"use{i}") for i in range(5) if med.get(f"use{i}")]
@@ -296,8 +605,11 @@ def build_overview(med):
         + stock_info
     )
 
+@metrics.timed("medicine_details")
 def get_medicine_details(med_name, intent):
-    med = mongo.db.medicines.find_one({"name": {"$regex": med_name, "$options": "i"}})
+    # Side effects and precautions aren't in the catalogue; the record
+    # reads them through medicine_details
+    med = catalogue_medicine(med_name) or find_medicine_by_name(med_name)
     if not med:
         return None
 
@@ -308,11 +620,15 @@ def get_medicine_details(med_name, intent):
     if intent == "DOSAGE":
         return f"The recommended dosage for {med['name']} is {med.get('dosage', 'not specified')}."
 
-    if intent == "SIDE_EFFECTS" and med.get("side_effects"):
-        return f"The side effects include {', '.join(med['side_effects'])}."
+    if intent == "SIDE_EFFECTS":
+        side_effects = med.get("side_effects")
+        if side_effects:
+            return f"The side effects include {', '.join(side_effects)}."
 
-    if intent == "PRECAUTIONS" and med.get("precautions"):
-        return f"Precautions include {', '.join(med['precautions'])}."
+    if intent == "PRECAUTIONS":
+        precautions = med.get("precautions")
+        if precautions:
+            return f"Precautions include {', '.join(precautions)}."
 
     if intent == "DELIVERY":
         return f"The delivery time for {med['name']} is {med.get('delivery_time', 'not specified')}."
@@ -323,28 +639,14 @@ def get_medicine_details(med_name, intent):
     return None
 
 # ---------- CART HANDLING ----------
-def text_to_int(text):
-    mapping = {
-        'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 
-        'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10
-    }
-    for t in text.lower().replace(',', ' ').split():
-        if t.isdigit(): 
-            return int(t)
-        if t in mapping: 
-            return mapping[t]
-    return None
-
-def handle_cart_chat(session, message):
-    msg = message.lower()
+@metrics.timed("handle_cart_chat")
+def handle_cart_chat(session, parsed):
+    msg = parsed.lower
     
     # 1. User asks to add to cart
     if "add to cart" in msg:
-        names = [m["name"] for m in mongo.db.medicines.find()]
-        # Extract potential matches
-        matches = process.extract(message, names, limit=5)
-        # Strict filter: Must be > 80% match
-        matched = [m[0] for m in matches if m[1] > 80]
+        # Extract potential matches; strict filter: must be > 80% match
+        matched = [m[0] for m in match_medicine_names(parsed.text, limit=5)]
         
         if matched:
             update_session(session["session_id"], {
@@ -364,7 +666,7 @@ def handle_cart_chat(session, message):
 
     # 2. User confirms quantity
     if session.get("awaiting_cart_confirmation"):
-        qty = text_to_int(message)
+        qty = parsed.number
         if qty:
             meds = session["last_medicines_for_cart"][:]
             
@@ -395,7 +697,7 @@ def handle_cart_chat(session, message):
 @app.route("/api/cart", methods=["GET"])
 def get_cart():
     session_id = get_session_id()
-    session = get_or_create_session(session_id)
+    session = session_store.get(session_id, session_writes(), fresh=True)
     cart = session.get("cart", [])
     return jsonify({"cart": {"items": cart}})
 
@@ -439,15 +741,14 @@ def update_cart_item():
     medicine_id = data.get("medicineId")
     quantity = data.get("quantity")
     
-    session = get_or_create_session(session_id)
-    cart = session.get("cart", [])
-    
-    for item in cart:
-        if item.get("medicineId") == medicine_id or item.get("name") == medicine_id:
-            item["quantity"] = int(quantity)
-            break
-            
-    update_session(session_id, {"cart": cart})
+    cart = update_cart(
+        session_id,
+        {"cart": {"$elemMatch": cart_item_match(medicine_id)}},
+        {"$set": {"cart.$.quantity": int(quantity)}},
+    )
+    if cart is None:
+        # Nothing to update; return the cart as it is
+        cart = session_store.get(session_id, session_writes(), fresh=True).get("cart", [])
     return jsonify({"cart": {"items": cart}})
 
 @app.route("/api/cart/delete", methods=["DELETE"])
@@ -456,46 +757,146 @@ def remove_from_cart():
     data = request.get_json(force=True)
     medicine_id = data.get("medicineId")
     
-    session = get_or_create_session(session_id)
-    cart = session.get("cart", [])
-    new_cart = [item for item in cart if item.get("medicineId") != medicine_id and item.get("name") != medicine_id]
-    
-    update_session(session_id, {"cart": new_cart})
+    new_cart = update_cart(
+        session_id,
+        {},
+        {"$pull": {"cart": cart_item_match(medicine_id)}},
+    )
+    if new_cart is None:
+        new_cart = get_or_create_session(session_id).get("cart", [])
     return jsonify({"cart": {"items": new_cart}})
 
 @app.route("/api/cart/clear", methods=["DELETE"])
 def clear_cart():
     session_id = get_session_id()
-    update_session(session_id, {"cart": []})
+    if update_cart(session_id, {}, {"$set": {"cart": []}}) is None:
+        get_or_create_session(session_id)
     return jsonify({"success": True, "message": "Cart cleared"})
 
 # ---------- MAIN CHAT ROUTE ----------
-@app.route("/chat", methods=["POST"])
-def chat():
+# First frame of /chat/stream, sent as soon as the intent is known
+ACK_MESSAGES = {
+    "ADD_TO_CART": "Updating your cart...",
+    "PRICE": "Checking the price...",
+    "DOSAGE": "Checking the dosage...",
+    "SIDE_EFFECTS": "Looking up the side effects...",
+    "PRECAUTIONS": "Looking up the precautions...",
+    "DELIVERY": "Checking the delivery time...",
+    "MEDICINE_OVERVIEW": "Looking up that medicine...",
+    "SYMPTOMS": "Looking for medicines that match your symptoms...",
+}
+ACK_DEFAULT = "Let me check..."
+
+def chat_request():
+    """``(session_id, session, user_message, limit)`` of a /chat request.
+
+    Raises ValueError for a bad ``k``.
+    """
     session_id = get_session_id()
-    session = get_or_create_session(session_id)
+    with metrics.span("session_load"):
+        session = get_or_create_session(session_id)
     data = request.get_json(force=True)
     user_message = data.get("message", "").strip()
+    return session_id, session, user_message, recommendation_limit(data.get("k"))
+
+@app.route("/chat", methods=["POST"])
+def chat():
+    try:
+        session_id, session, user_message, limit = chat_request()
+    except ValueError as e:
+        return jsonify({"error": f"Bad k: {e}"}), 400
+
+    reply, status = process_chat_message(session_id, session, user_message, limit)
+    return jsonify(reply), status
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """/chat as Server-Sent Events, for clients that render as it goes.
+
+    Same body and session handling as /chat; an empty message or bad ``k``
+    gets the same JSON error instead of a stream.
+    """
+    try:
+        session_id, session, user_message, limit = chat_request()
+    except ValueError as e:
+        return jsonify({"error": f"Bad k: {e}"}), 400
+    if not user_message:
+        reply, status = process_chat_message(session_id, session, user_message, limit)
+        return jsonify(reply), status
+    frames = chat_stream_frames(session_id, session, user_message, limit)
+    g.session_writes_streamed = True
+    return Response(stream_with_context(frames), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+# Proxies (nginx) must pass frames on as they come rather than buffer them
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def sse_frame(event, data):
+    return f"event: {event}\ndata: {app.json.dumps(data)}\n\n"
+
+def chat_stream_frames(session_id, session, user_message, limit):
+    """``chat_steps`` as SSE frames: ``ack``, ``intro``, ``medicine``...
+    then ``done``, carrying the /chat body plus its ``status``."""
+    try:
+        with metrics.message():
+            for step, data in chat_steps(session_id, session, user_message, limit):
+                if step == "reply":
+                    reply, status = data
+                    step, data = "done", dict(reply, status=status)
+                    # Stored before "done", or the client gets "error" instead
+                    commit_session_writes()
+                yield sse_frame(step, data)
+    except Exception as e:
+        print(f"Chat stream error: {e}")
+        yield sse_frame("error", {"error": str(e), "status": 500})
+    finally:
+        # Anything not written yet (the client left early) goes at teardown
+        g.pop("session_writes_streamed", None)
+
+def process_chat_message(session_id, session, user_message, limit=RECOMMENDATION_LIMIT):
+    """The /chat pipeline for one message; returns ``(reply, status)``.
+
+    ``limit`` caps the number of suggested medicines.
+    """
+    with metrics.message():
+        return answer_chat_message(session_id, session, user_message, limit)
+
+def answer_chat_message(session_id, session, user_message, limit):
+    for step, data in chat_steps(session_id, session, user_message, limit):
+        if step == "reply":
+            return data
 
+def chat_steps(session_id, session, user_message, limit):
+    """The /chat pipeline as it goes: ``(step, data)`` pairs.
+
+    ``ack`` once the intent is known, and for symptom replies ``intro``
+    and one ``medicine`` per recommendation as its line is written; the
+    last step is always ``reply``, with the ``(reply, status)`` of /chat.
+    """
     if not user_message:
-        return jsonify({"message": "Please enter a message.", "medicines": []}), 400
+        yield "reply", ({"message": "Please enter a message.", "medicines": []}, 400)
+        return
 
-    intent = detect_intent(user_message)
+    parsed = parse_message(user_message)
+    intent = detect_intent(parsed)
+    metrics.set_intent(intent)
+    yield "ack", {"intent": intent, "message": ACK_MESSAGES.get(intent, ACK_DEFAULT)}
 
     # Cart handling
-    cart_result = handle_cart_chat(session, user_message)
+    cart_result = handle_cart_chat(session, parsed)
     if cart_result:
         save_chat_turn(session_id, user_message, cart_result["message"])
-        return jsonify(cart_result)
+        yield "reply", (cart_result, 200)
+        return
 
-    if "proceed to checkout" in user_message.lower():
-        return jsonify({"type": "PROCEED_TO_CHECKOUT", "message": "Taking you to the checkout page."})
+    if "proceed to checkout" in parsed.lower:
+        yield "reply", ({"type": "PROCEED_TO_CHECKOUT", "message": "Taking you to the checkout page."}, 200)
+        return
 
     # Detect medicine mention
-    medicine_names = [m["name"] for m in mongo.db.medicines.find()]
-    match = process.extract(user_message, medicine_names, limit=1)
+    with metrics.span("medicine_mention"):
+        match = match_medicine_names(parsed.text, limit=1)
 
-    if match and match[0][1] > 80:
+    if match:
         update_session(session_id, {"last_mentioned_medicine": match[0][0]})
         session["last_mentioned_medicine"] = match[0][0]
 
@@ -504,13 +905,15 @@ def chat():
         reply = get_medicine_details(session["last_mentioned_medicine"], intent)
         if reply:
             save_chat_turn(session_id, user_message, reply, medicines=[session["last_mentioned_medicine"]])
-            return jsonify({"message": reply, "medicines": []})
+            yield "reply", ({"message": reply, "medicines": []}, 200)
+            return
 
     # 2) Symptom-based
-    symptoms = extract_symptoms_from_text(user_message)
+    symptoms = extract_symptoms_from_text(parsed)
     
     if not user_message.strip():
-        return jsonify({"message": "Hi! What symptoms do you have?", "medicines": []})
+        yield "reply", ({"message": "Hi! What symptoms do you have?", "medicines": []}, 200)
+        return
 
     # Typo Correction
     common_symptoms = ["ulcer", "fever", "pain", "headache", "cold", "cough", "stomach", "acidity", "vomiting"]
@@ -522,14 +925,13 @@ def chat():
                 break
 
     # Allergy Handling
-    user_lower = user_message.lower()
-    is_allergy_query = any(k in user_lower for k in ["allergic", "allergy", "rash", "reaction", "hives", "itching"])
+    is_allergy_query = "ALLERGY" in parsed.keywords
     
     if is_allergy_query:
-        meds = find_medicines(["allergic rhinitis", "hay fever", "urticaria", "allergies", "itching"])
+        meds = find_medicines(["allergic rhinitis", "hay fever", "urticaria", "allergies", "itching"], limit)
         intro_text = "Here are medicines commonly used for allergies:\n"
     else:
-        meds = find_medicines(symptoms)
+        meds = find_medicines(symptoms, limit)
         intro_text = "Based on what you described, these medicines may help:\n"
 
     meds = [m for m in meds if m.get("availability") == "In stock"]
@@ -537,7 +939,8 @@ def chat():
     if meds:
         update_session(session_id, {"last_mentioned_medicine": meds[0]["name"]})
         msg_lines = [intro_text]
-        for med in meds:
+        yield "intro", {"message": intro_text}
+        for index, med in enumerate(meds):
             # FIX: Human-friendly match text instead of raw percentage
             score = med.get('score', 0)
             if score > 130:
@@ -555,23 +958,176 @@ def chat():
                 f"\n  Delivery: {med.get('delivery_time', 'Standard')}"
                 f"\n  Availability: {med.get('availability', 'In Stock')}"
             )
+            yield "medicine", {"index": index, "medicine": med, "text": msg_lines[-1]}
         msg = "\n".join(msg_lines)
         save_chat_turn(session_id, user_message, msg, medicines=[m["name"] for m in meds])
-        return jsonify({"message": msg, "medicines": meds})
+        yield "reply", ({"message": msg, "medicines": meds}, 200)
+        return
 
     # 3) Fallback
     fallback = "I'm not fully sure what you mean. You can tell me your symptoms (for example: stomach pain, fever, acidity) or ask about a specific medicine."
     save_chat_turn(session_id, user_message, fallback)
-    return jsonify({"message": fallback, "medicines": []})
+    yield "reply", ({"message": fallback, "medicines": []}, 200)
+
+# Cap on messages per /chat/batch request
+CHAT_BATCH_MAX = int(os.environ.get("CHAT_BATCH_MAX", "5000"))
+
+@app.route("/chat/batch", methods=["POST"])
+def chat_batch():
+    """Run an array of ``{session_id, message, k}`` through the /chat pipeline.
+
+    Messages are processed in input order, so each session sees its own
+    messages in order, and results come back in the same order. Sessions
+    are read once up front; session updates and chat log inserts are sent
+    as one bulk write each at the end.
+    """
+    data = request.get_json(force=True)
+    items = data.get("messages") if isinstance(data, dict) else data
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return jsonify({"error": "Expected an array of {session_id, message} objects"}), 400
+    if len(items) > CHAT_BATCH_MAX:
+        return jsonify({"error": f"At most {CHAT_BATCH_MAX} messages per batch"}), 413
+
+    # Items without a session_id fall back to the caller's own session
+    default_session_id = get_session_id()
+    session_ids = [item.get("session_id") or default_session_id for item in items]
+
+    with metrics.span("session_load"):
+        session_store.prefetch(session_ids, session_writes())
+    g.chat_turns = []
+    results = []
+    try:
+        for session_id, item in zip(session_ids, items):
+            try:
+                limit = recommendation_limit(item.get("k"))
+            except ValueError as e:
+                results.append({"session_id": session_id, "status": 400, "response": {"error": f"Bad k: {e}"}})
+                continue
+            try:
+                session = get_or_create_session(session_id)
+                user_message = str(item.get("message") or "").strip()
+                reply, status = process_chat_message(session_id, session, user_message, limit)
+            except Exception as e:
+                print(f"Batch chat error: {e}")
+                reply, status = {"error": str(e)}, 500
+            results.append({"session_id": session_id, "status": status, "response": reply})
+    finally:
+        transcripts.write_many(g.pop("chat_turns"))
+
+    return jsonify({"results": results})
 
 # ---------- HISTORY ----------
+# Turns per page when no limit is given, and the most a page may hold
+CHAT_HISTORY_LIMIT = int(os.environ.get("CHAT_HISTORY_LIMIT", "200"))
+CHAT_HISTORY_MAX_LIMIT = int(os.environ.get("CHAT_HISTORY_MAX_LIMIT", "1000"))
+
+# Only what Chatbot.jsx renders, plus the cursor fields
+HISTORY_PROJECTION = {"user_message": 1, "bot_message": 1, "timestamp": 1}
+
+def parse_timestamp(value):
+    """ISO 8601 timestamp (as returned by /chat_history) to naive UTC."""
+    ts = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+def history_bound(args, name, op):
+    """Query condition for the ``before``/``after`` cursor, or None.
+
+    ``<name>_id`` breaks ties between turns logged in the same millisecond.
+    """
+    value = args.get(name)
+    if not value:
+        return None
+    ts = parse_timestamp(value)
+    turn_id = args.get(f"{name}_id")
+    if not turn_id:
+        return {"timestamp": {op: ts}}
+    return {"$or": [
+        {"timestamp": {op: ts}},
+        {"timestamp": ts, "_id": {op: ObjectId(turn_id)}},
+    ]}
+
+def history_query(session_id, args, accept):
+    """``(query, limit, newest_first, stream)`` for a /chat_history request.
+
+    Raises ValueError or InvalidId for a bad cursor or limit.
+    """
+    stream = args.get("format") == "ndjson" or "application/x-ndjson" in accept
+    bounds = [b for b in (history_bound(args, "after", "$gt"), history_bound(args, "before", "$lt")) if b]
+    limit = args.get("limit")
+    if limit is not None:
+        limit = int(limit)
+        if limit < 1:
+            raise ValueError("limit must be positive")
+        limit = min(limit, CHAT_HISTORY_MAX_LIMIT)
+    elif not stream:
+        limit = CHAT_HISTORY_LIMIT
+
+    query = {"session_id": session_id}
+    if bounds:
+        query["$and"] = bounds
+
+    # A page ending at ``before`` (or the latest page) is read newest first
+    newest_first = limit is not None and not args.get("after")
+    return query, limit, newest_first, stream
+
+def history_item(turn):
+    timestamp = turn.get("timestamp")
+    return {
+        "id": str(turn["_id"]),
+        "user_message": turn.get("user_message"),
+        "bot_message": turn.get("bot_message"),
+        "timestamp": timestamp.isoformat(timespec="milliseconds") + "Z" if timestamp else None,
+    }
+
 @app.route("/chat_history", methods=["GET"])
 def history():
+    """Chat turns of the session, oldest first.
+
+    Without a cursor the latest ``limit`` turns are returned. Pass the
+    first turn's ``timestamp``/``id`` as ``before``/``before_id`` for the
+    page before it, or the last turn's as ``after``/``after_id`` to page
+    forward. ``format=ndjson`` streams one turn per line straight from the
+    cursor, and then reads the whole history unless ``limit`` is given.
+    """
     session_id = get_session_id()
-    chats = mongo.db.chats.find({"session_id": session_id}, {"_id": 0}).sort("timestamp", 1)
-    return jsonify(list(chats))
+    try:
+        query, limit, newest_first, stream = history_query(
+            session_id, request.args, request.headers.get("Accept", "")
+        )
+    except (ValueError, InvalidId) as e:
+        return jsonify({"error": f"Bad history query: {e}"}), 400
+
+    direction = -1 if newest_first else 1
+    chats = mongo.db.chats.find(query, HISTORY_PROJECTION).sort([("timestamp", direction), ("_id", direction)])
+    if limit is not None:
+        chats = chats.limit(limit)
+    if newest_first:
+        # At most ``limit`` turns held in memory
+        chats = reversed(list(chats))
+
+    if stream:
+        lines = (json.dumps(history_item(turn)) + "\n" for turn in chats)
+        return Response(lines, mimetype="application/x-ndjson")
+    return jsonify([history_item(turn) for turn in chats])
 
 # ---------- HEALTH CHECK ----------
+def health_report(mongo_ok):
+    """Health check body, shared with the ASGI app."""
+    return {
+        "status": "ok",
+        "mongo": mongo_ok,
+        "catalogue": catalogue.stats(),
+        "medicine_details": medicine_details.stats(),
+        "transcripts": transcripts.stats(),
+        "sessions": session_store.stats(),
+        "recommendations": recommendations.stats(),
+        "matcher": keyword_automaton.stats(),
+        "indexes": index_bootstrap.stats(),
+        "warm_up": warm_up.stats(),
+    }
+
 @app.route("/", methods=["GET"])
 def health():
     try:
@@ -579,7 +1135,99 @@ def health():
         mongo_ok = True
     except Exception:
         mongo_ok = False
-    return jsonify({"status": "ok", "mongo": mongo_ok}), 200
+    return jsonify(health_report(mongo_ok)), 200
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the process is up. Nothing remote is checked."""
+    return jsonify({"status": "ok"}), 200
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: catalogue, matchers and symptom index loaded (503 until then)."""
+    report = warm_up.stats()
+    return jsonify(report), 200 if report["ready"] else 503
+
+# ---------- ADMIN ----------
+# Admin routes are off unless a token is configured
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+def is_admin(headers):
+    token = headers.get("X-Admin-Token") or ""
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+def reload_catalogue_report():
+    """Re-read the catalogue now rather than on the next change event or poll.
+
+    A new version reaches the matcher, name matcher and symptom index the
+    same way a change stream event would; returns ``(body, status)``.
+    """
+    try:
+        catalogue.refresh()
+    except Exception as e:
+        return {"error": f"Catalogue reload failed: {e}"}, 503
+    return {"catalogue": catalogue.stats(), "matcher": keyword_automaton.stats()}, 200
+
+@app.route("/admin/catalogue/reload", methods=["POST"])
+def reload_catalogue():
+    if not is_admin(request.headers):
+        return jsonify({"error": "Forbidden"}), 403
+    body, status = reload_catalogue_report()
+    return jsonify(body), status
+
+def mongo_profile_report(args):
+    """Latest request profiles, newest first; ``(body, status)``.
+
+    ``?flagged=1`` keeps only requests with repeated or N+1 commands.
+    """
+    if not profiler.enabled:
+        return {"error": "Mongo profiling is disabled (set MONGO_PROFILE=1)"}, 404
+    try:
+        limit = int(args["limit"]) if args.get("limit") else None
+    except ValueError:
+        return {"error": "limit must be an integer"}, 400
+    return profiler.report(flagged_only=args.get("flagged") == "1", limit=limit), 200
+
+@app.route("/admin/mongo-profile", methods=["GET"])
+def mongo_profile():
+    if not is_admin(request.headers):
+        return jsonify({"error": "Forbidden"}), 403
+    body, status = mongo_profile_report(request.args)
+    return jsonify(body), status
+
+# ---------- METRICS EXPORT ----------
+def metric_samples():
+    """Gauges and counters kept by the caches and the matcher."""
+    matcher = keyword_automaton.stats()
+    last_change = matcher["last_change"] or {}
+    cached = recommendations.stats()
+    sessions = session_store.stats()
+    return [
+        ("chat_ready", "gauge", "1 once everything /readyz waits for is loaded.", warm_up.ready()),
+        ("chat_catalogue_version", "gauge", "Catalogue version in memory.", catalogue.stats()["version"]),
+        ("chat_matcher_version", "gauge", "Catalogue version the phrase matcher is built from.", matcher["version"]),
+        ("chat_matcher_phrases", "gauge", "Use phrases in the phrase matcher.", matcher["phrases"]),
+        ("chat_matcher_delta_phrases", "gauge", "Phrases added since the last full build.", matcher["delta_phrases"]),
+        ("chat_matcher_builds_total", "counter", "Full phrase matcher builds.", matcher["builds"]),
+        ("chat_matcher_updates_total", "counter", "Incremental phrase matcher updates.", matcher["updates"]),
+        ("chat_matcher_build_seconds_total", "counter", "Time spent building and updating the matcher.",
+         matcher["build_seconds"]),
+        ("chat_matcher_last_change_seconds", "gauge", "Duration of the latest matcher build or update.",
+         last_change.get("seconds")),
+        ("chat_recommendation_cache_hits_total", "counter", "Rankings served from cache.", cached["hits"]),
+        ("chat_recommendation_cache_misses_total", "counter", "Rankings computed.", cached["misses"]),
+        ("chat_session_cache_hits_total", "counter", "Sessions served from cache.", sessions["hits"]),
+        ("chat_session_cache_misses_total", "counter", "Sessions read from Mongo.", sessions["misses"]),
+    ]
+
+metrics.collectors.append(metric_samples)
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus text format; 404 unless CHAT_METRICS=1."""
+    if not metrics.enabled:
+        return jsonify({"error": "Metrics are disabled (set CHAT_METRICS=1)"}), 404
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
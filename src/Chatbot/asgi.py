@@ -0,0 +1,426 @@
+"""
+ASGI entry point for the chatbot service.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+
+Serves /chat, /chat/stream, /chat_history, /api/cart*, /, /healthz,
+/readyz, /metrics and /admin/* like the Flask app, sharing its
+catalogue, caches and session store, but on PyMongo's async client
+(``AsyncMongoClient``), so a request waiting on Mongo doesn't hold a
+worker thread. /chat reads the session and checks the catalogue snapshot
+concurrently, then runs the chat pipeline (intent detection, symptom
+ranking, medicine lookups) on a worker thread, where its remaining
+queries still go through the sync client. /chat/batch and the CLI stay
+Flask only.
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+from bson.objectid import ObjectId, InvalidId
+from flask import g
+from pymongo import AsyncMongoClient, ReturnDocument
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Match, Route
+
+import app as chatbot
+from medicine_catalogue import name_key
+from session_store import SessionWrites
+
+
+# ---------- MONGO ----------
+def db():
+    """The async driver's database, the same one ``chatbot.mongo.db`` uses."""
+    return app.state.db
+
+@asynccontextmanager
+async def lifespan(app):
+    client = None
+    app.state.db = None
+    if chatbot.MONGO_URI and chatbot.mongo.db is not None:
+        listeners = chatbot.metrics.event_listeners() + chatbot.profiler.event_listeners()
+        client = AsyncMongoClient(chatbot.MONGO_URI, event_listeners=listeners)
+        app.state.db = client[chatbot.mongo.db.name]
+    try:
+        yield
+    finally:
+        if client is not None:
+            await client.close()
+
+async def json_body(request):
+    # Like Flask's get_json(force=True): the content type isn't checked
+    try:
+        return await request.json()
+    except ValueError:
+        raise HTTPException(400, "Failed to decode JSON object")
+
+# ---------- SESSION UTILITIES ----------
+@asynccontextmanager
+async def session_writes():
+    """Session updates of one request, written when it ends (the Flask
+    app's ``commit_session_writes``)."""
+    writes = SessionWrites()
+    try:
+        yield writes
+    finally:
+        await chatbot.session_store.commit_async(writes, db().sessions)
+
+async def update_cart(writes, session_id, query, update):
+    """Async ``chatbot.update_cart``: the cart after the update, or None."""
+    query = dict(query, session_id=session_id)
+    session = await db().sessions.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+    if session is None:
+        return None
+    return chatbot.session_store.refresh(session, writes).get("cart", [])
+
+async def find_medicine_by_name(med_name):
+    key = name_key(med_name)
+    if not key:
+        return None
+    medicines = db().medicines
+    med = await medicines.find_one({"name_key": key}) or await medicines.find_one(chatbot.name_query(med_name))
+    if med:
+        return med
+
+    # May load the catalogue, so off the event loop
+    match = await run_in_threadpool(chatbot.match_medicine_names, med_name, 1)
+    if match and name_key(match[0][0]) != key:
+        name = match[0][0]
+        return (await medicines.find_one({"name_key": name_key(name)})
+                or await medicines.find_one(chatbot.name_query(name)))
+    return None
+
+async def add_item_to_cart(writes, session_id, item_name, quantity, price=None, medicine_id=None):
+    """Async ``chatbot.add_item_to_cart``, with the same atomic updates."""
+    if not price or not medicine_id:
+        # The snapshot first, as get_medicine_details does; may load it
+        med = await run_in_threadpool(chatbot.catalogue_medicine, item_name)
+        price, medicine_id = chatbot.cart_item_details(med or await find_medicine_by_name(item_name))
+
+    updates = chatbot.cart_add_updates(item_name, quantity, price, medicine_id)
+    for _ in range(chatbot.CART_UPDATE_ATTEMPTS):
+        for query, update in updates:
+            cart = await update_cart(writes, session_id, query, update)
+            if cart is not None:
+                return cart
+
+        # No session document yet
+        await db().sessions.update_one(
+            {"session_id": session_id},
+            {"$setOnInsert": chatbot.session_defaults(session_id)},
+            upsert=True,
+        )
+    raise RuntimeError(f"Cart update for {item_name} kept conflicting, giving up")
+
+# ---------- CART ROUTES ----------
+async def get_cart(request):
+    session_id = chatbot.get_session_id(request.headers)
+    async with session_writes() as writes:
+        session = await chatbot.session_store.get_async(session_id, writes, db().sessions, fresh=True)
+    return JSONResponse({"cart": {"items": session.get("cart", [])}})
+
+async def api_add_to_cart(request):
+    try:
+        session_id = chatbot.get_session_id(request.headers)
+        data = await json_body(request)
+
+        # Handle both Name (Chatbot) and ID (Frontend)
+        input_val = data.get("medicineId") or data.get("name")
+        quantity = int(data.get("quantity", 1))
+
+        resolved_name = None
+        resolved_id = None
+
+        if input_val:
+            if ObjectId.is_valid(input_val):
+                med = await db().medicines.find_one({"_id": ObjectId(input_val)})
+                if med:
+                    resolved_name = med["name"]
+                    resolved_id = str(med["_id"])
+            if not resolved_name:
+                resolved_name = input_val
+
+        if not resolved_name:
+            return JSONResponse({"error": "Product name/ID required"}, 400)
+
+        async with session_writes() as writes:
+            updated_cart = await add_item_to_cart(
+                writes, session_id, resolved_name, quantity, medicine_id=resolved_id
+            )
+        return JSONResponse({"success": True, "cart": {"items": updated_cart}})
+    except Exception as e:
+        print(f"API Error: {e}")
+        return JSONResponse({"error": str(e)}, 500)
+
+async def update_cart_item(request):
+    session_id = chatbot.get_session_id(request.headers)
+    data = await json_body(request)
+    medicine_id = data.get("medicineId")
+    quantity = data.get("quantity")
+
+    async with session_writes() as writes:
+        cart = await update_cart(
+            writes,
+            session_id,
+            {"cart": {"$elemMatch": chatbot.cart_item_match(medicine_id)}},
+            {"$set": {"cart.$.quantity": int(quantity)}},
+        )
+        if cart is None:
+            # Nothing to update; return the cart as it is
+            session = await chatbot.session_store.get_async(session_id, writes, db().sessions, fresh=True)
+            cart = session.get("cart", [])
+    return JSONResponse({"cart": {"items": cart}})
+
+async def remove_from_cart(request):
+    session_id = chatbot.get_session_id(request.headers)
+    data = await json_body(request)
+    medicine_id = data.get("medicineId")
+
+    async with session_writes() as writes:
+        cart = await update_cart(
+            writes, session_id, {}, {"$pull": {"cart": chatbot.cart_item_match(medicine_id)}}
+        )
+        if cart is None:
+            session = await chatbot.session_store.get_async(session_id, writes, db().sessions)
+            cart = session.get("cart", [])
+    return JSONResponse({"cart": {"items": cart}})
+
+async def clear_cart(request):
+    session_id = chatbot.get_session_id(request.headers)
+    async with session_writes() as writes:
+        if await update_cart(writes, session_id, {}, {"$set": {"cart": []}}) is None:
+            await chatbot.session_store.get_async(session_id, writes, db().sessions)
+    return JSONResponse({"success": True, "message": "Cart cleared"})
+
+# ---------- MAIN CHAT ROUTE ----------
+def run_chat(session_id, writes, user_message, limit):
+    """``chatbot.process_chat_message`` on a worker thread; the session is
+    already in ``writes``, and its updates are collected there."""
+    with chatbot.app.app_context():
+        g.session_writes = writes
+        session = chatbot.get_or_create_session(session_id)
+        return chatbot.process_chat_message(session_id, session, user_message, limit)
+
+def run_chat_stream(session_id, writes, user_message, limit, emit):
+    """``chatbot.chat_stream_frames`` on a worker thread, each frame handed
+    to ``emit`` as it is produced; ``emit(None)`` marks the end. The frames
+    commit ``writes`` before "done", leaving ``session_writes`` nothing to do."""
+    try:
+        with chatbot.app.app_context():
+            g.session_writes = writes
+            session = chatbot.get_or_create_session(session_id)
+            for frame in chatbot.chat_stream_frames(session_id, session, user_message, limit):
+                emit(frame)
+    finally:
+        emit(None)
+
+async def load_chat_session(session_id, writes):
+    # Independent reads: the session, and the catalogue snapshot the
+    # matchers and symptom index are built from (loaded if it isn't yet)
+    with chatbot.metrics.span("session_load"):
+        await asyncio.gather(
+            chatbot.session_store.get_async(session_id, writes, db().sessions),
+            run_in_threadpool(chatbot.catalogue.get),
+        )
+
+async def chat_request(request):
+    """``(session_id, user_message, limit)``; raises ValueError for a bad ``k``."""
+    session_id = chatbot.get_session_id(request.headers)
+    data = await json_body(request)
+    user_message = data.get("message", "").strip()
+    return session_id, user_message, chatbot.recommendation_limit(data.get("k"))
+
+async def answer(session_id, user_message, limit):
+    async with session_writes() as writes:
+        await load_chat_session(session_id, writes)
+        return await run_in_threadpool(run_chat, session_id, writes, user_message, limit)
+
+async def chat(request):
+    try:
+        session_id, user_message, limit = await chat_request(request)
+    except ValueError as e:
+        return JSONResponse({"error": f"Bad k: {e}"}, 400)
+    reply, status = await answer(session_id, user_message, limit)
+    return JSONResponse(reply, status)
+
+async def chat_stream(request):
+    """The Flask app's /chat/stream. The pipeline runs on one worker thread
+    and its frames are passed back through a queue as they come."""
+    try:
+        session_id, user_message, limit = await chat_request(request)
+    except ValueError as e:
+        return JSONResponse({"error": f"Bad k: {e}"}, 400)
+    if not user_message:
+        reply, status = await answer(session_id, user_message, limit)
+        return JSONResponse(reply, status)
+
+    async def frames():
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def emit(frame):
+            loop.call_soon_threadsafe(queue.put_nowait, frame)
+
+        async with session_writes() as writes:
+            await load_chat_session(session_id, writes)
+            producer = asyncio.ensure_future(
+                run_in_threadpool(run_chat_stream, session_id, writes, user_message, limit, emit)
+            )
+            try:
+                while (frame := await queue.get()) is not None:
+                    yield frame
+            finally:
+                # The session write waits for the pipeline, even if the client left
+                await producer
+
+    return StreamingResponse(frames(), media_type="text/event-stream", headers=chatbot.SSE_HEADERS)
+
+# ---------- HISTORY ----------
+def history_lines(turns):
+    return (json.dumps(chatbot.history_item(turn)) + "\n" for turn in turns)
+
+async def stream_history(chats):
+    async for turn in chats:
+        yield json.dumps(chatbot.history_item(turn)) + "\n"
+
+async def history(request):
+    """Same paging and ``format=ndjson`` streaming as the Flask route."""
+    session_id = chatbot.get_session_id(request.headers)
+    try:
+        query, limit, newest_first, stream = chatbot.history_query(
+            session_id, request.query_params, request.headers.get("Accept", "")
+        )
+    except (ValueError, InvalidId) as e:
+        return JSONResponse({"error": f"Bad history query: {e}"}, 400)
+
+    direction = -1 if newest_first else 1
+    chats = db().chats.find(query, chatbot.HISTORY_PROJECTION).sort([("timestamp", direction), ("_id", direction)])
+    if limit is not None:
+        chats = chats.limit(limit)
+    if not newest_first:
+        if stream:
+            return StreamingResponse(stream_history(chats), media_type="application/x-ndjson")
+        turns = await chats.to_list(None)
+    else:
+        # At most ``limit`` turns held in memory
+        turns = reversed(await chats.to_list(None))
+
+    if stream:
+        return StreamingResponse(history_lines(turns), media_type="application/x-ndjson")
+    return JSONResponse([chatbot.history_item(turn) for turn in turns])
+
+# ---------- HEALTH CHECK ----------
+async def health(request):
+    try:
+        await db().command("ping")
+        mongo_ok = True
+    except Exception:
+        mongo_ok = False
+    return JSONResponse(chatbot.health_report(mongo_ok))
+
+async def reload_catalogue(request):
+    if not chatbot.is_admin(request.headers):
+        return JSONResponse({"error": "Forbidden"}, 403)
+    body, status = await run_in_threadpool(chatbot.reload_catalogue_report)
+    return JSONResponse(body, status)
+
+async def mongo_profile(request):
+    if not chatbot.is_admin(request.headers):
+        return JSONResponse({"error": "Forbidden"}, 403)
+    body, status = chatbot.mongo_profile_report(request.query_params)
+    return JSONResponse(body, status)
+
+async def metrics_endpoint(request):
+    if not chatbot.metrics.enabled:
+        return JSONResponse({"error": "Metrics are disabled (set CHAT_METRICS=1)"}, 404)
+    return Response(chatbot.metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+async def healthz(request):
+    return JSONResponse({"status": "ok"})
+
+async def readyz(request):
+    report = chatbot.warm_up.stats()
+    return JSONResponse(report, 200 if report["ready"] else 503)
+
+def endpoint_name(scope):
+    """The matched route function's name, like Flask's ``request.endpoint``."""
+    for route in app.routes:
+        if route.matches(scope)[0] == Match.FULL:
+            return route.name
+    return "unmatched"
+
+class RequestMetrics:
+    """Request latency and Mongo operations per endpoint, like the Flask
+    app's request hooks; endpoints are named after the route functions."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not chatbot.metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+        token = chatbot.metrics.begin(endpoint_name(scope))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            chatbot.metrics.end(token)
+
+class MongoProfile:
+    """The Flask app's Mongo profiler hooks: profiles each request and,
+    if enabled, adds the ``Server-Timing`` header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        profiler = chatbot.profiler
+        if scope["type"] != "http" or not profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+        token = profiler.begin(endpoint_name(scope), scope["method"], scope["path"])
+        profile = profiler.current()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                stats = chatbot.metrics.current()
+                value = profiler.timing_header(profile, stats.spans if stats else ())
+                message = dict(message, headers=list(message.get("headers", [])) + [
+                    (b"server-timing", value.encode("latin-1"))
+                ])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing if profiler.server_timing else send)
+        finally:
+            profiler.end(token)
+
+app = Starlette(
+    routes=[
+        Route("/api/cart", get_cart, methods=["GET"]),
+        Route("/api/cart/add", api_add_to_cart, methods=["POST"]),
+        Route("/api/cart/update", update_cart_item, methods=["PUT"]),
+        Route("/api/cart/delete", remove_from_cart, methods=["DELETE"]),
+        Route("/api/cart/clear", clear_cart, methods=["DELETE"]),
+        Route("/chat", chat, methods=["POST"]),
+        Route("/chat/stream", chat_stream, methods=["POST"]),
+        Route("/chat_history", history, methods=["GET"]),
+        Route("/", health, methods=["GET"]),
+        Route("/healthz", healthz, methods=["GET"]),
+        Route("/readyz", readyz, methods=["GET"]),
+        Route("/admin/catalogue/reload", reload_catalogue, methods=["POST"]),
+        Route("/admin/mongo-profile", mongo_profile, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+    ],
+    middleware=[
+        Middleware(RequestMetrics),
+        Middleware(MongoProfile),
+        Middleware(CORSMiddleware, allow_origins=chatbot.FRONTEND_URLS, allow_methods=["*"], allow_headers=["*"]),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,27 @@
+"""
+Start-once guard for the background threads of the chatbot's components.
+
+Threads don't survive a fork, so a worker forked from a preloaded app has
+to start its own; each component starts its thread on first use in every
+process.
+"""
+import os
+import threading
+
+
+class OncePerProcess:
+    """``claim()`` is True for the first caller in each process (fork safe)."""
+
+    def __init__(self):
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def claim(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return False
+        with self._lock:
+            if self._pid == pid:
+                return False
+            self._pid = pid
+            return True
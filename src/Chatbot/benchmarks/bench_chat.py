@@ -0,0 +1,373 @@
+"""
+Reproducible /chat benchmark on a local Mongo stand-in.
+
+    pip install mongomock
+    python benchmarks/bench_chat.py [--sizes 1000 10000 100000] [--turns 1000] [--save base.json]
+    python benchmarks/bench_chat.py --compare base.json        # after a change
+
+Every catalogue size runs in its own interpreter: a fresh mongomock
+database (or ``--mongo-uri``, a real mongod whose database name contains
+"bench", dropped and reseeded) is seeded with the dataset.json medicines
+padded with synthetic ones reusing their names and uses, app.py is
+imported against it and warmed up, and a seeded mix of conversations is
+replayed through the Flask test client: symptom descriptions, price and
+dosage questions, "add to cart" and the quantity reply that follows it.
+
+Reported per size and per kind of turn are latency percentiles, turns per
+second, and the Mongo operations each turn sent from the request thread
+with the time spent in them (background transcript and session flushes
+are not counted). ``--save``
+writes the results as JSON and ``--compare`` prints the change against a
+saved run. Only runs on the same machine, stand-in and arguments compare.
+
+mongomock has no indexes and is not what a mongod costs per round trip
+(at 100k medicines a turn takes seconds; try ``--turns 300`` there first):
+compare latency minus Mongo time and the number of operations, and use
+``--mongo-uri`` for end-to-end latency. The
+catalogue poll is pushed out of the run (as with a change stream) unless
+CATALOGUE_POLL_SECONDS is set.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+CHATBOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CHATBOT)
+
+from medicine_catalogue import name_key  # noqa: E402
+
+DATASET = os.path.join(CHATBOT, "dataset.json")
+KINDS = ["symptom", "price", "dosage", "add_to_cart", "quantity"]
+# The quantity reply follows every add_to_cart, so it has no weight of its own
+MIX = {"symptom": 40, "price": 20, "dosage": 20, "add_to_cart": 20}
+QUANTITIES = ["two", "3", "1", "five", "I want 2 please"]
+SYMPTOM_TEMPLATES = [
+    "I have {0}",
+    "I am suffering from {0} and {1}",
+    "I have {0} and {1} since yesterday",
+    "what should I take for {0}",
+]
+MONGO_METHODS = [
+    "find", "find_one", "find_one_and_update", "insert_one", "insert_many",
+    "update_one", "update_many", "replace_one", "delete_one", "delete_many",
+    "bulk_write", "aggregate", "count_documents", "distinct",
+]
+
+
+def uses_of(med):
+    return [med[f"use{i}"] for i in range(5) if med.get(f"use{i}")]
+
+
+def catalogue(size, rng):
+    base = [m for m in json.load(open(DATASET, encoding="utf-8")) if uses_of(m)]
+    uses = sorted({use for m in base for use in uses_of(m)})
+    medicines = [dict(m) for m in base[:size]]
+    while len(medicines) < size:
+        template = rng.choice(base)
+        med = {k: v for k, v in template.items() if not k.startswith("use")}
+        med["name"] = f"{template['name']} {len(medicines)}"
+        for i, use in enumerate(rng.sample(uses, rng.randint(1, 5))):
+            med[f"use{i}"] = use
+        medicines.append(med)
+    return medicines, uses
+
+
+def seeded(size, rng):
+    """``catalogue`` with the ``_id`` and ``name_key`` each medicine is stored with."""
+    from bson import ObjectId
+
+    medicines, uses = catalogue(size, rng)
+    for i, med in enumerate(medicines):
+        # name_key as the backend model saves it; backfilling 100k through mongomock is quadratic
+        med.update(_id=ObjectId("%024x" % (i + 1)), name_key=name_key(med["name"]))
+    return medicines, uses
+
+
+def conversation(rng, names, uses, sessions, turns):
+    """``(kind, session_id, message)`` turns, an add_to_cart followed by its quantity."""
+    kinds, weights = zip(*MIX.items())
+    script = []
+    while len(script) < turns:
+        session_id = f"bench-{rng.randrange(sessions)}"
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "symptom":
+            message = rng.choice(SYMPTOM_TEMPLATES).format(*rng.sample(uses, 2))
+        elif kind == "price":
+            message = f"what is the price of {rng.choice(names)}"
+        elif kind == "dosage":
+            message = f"what is the dosage of {rng.choice(names)}"
+        else:
+            script.append((kind, session_id, f"add to cart {rng.choice(names)}"))
+            kind, message = "quantity", rng.choice(QUANTITIES)
+        script.append((kind, session_id, message))
+    return script[:turns]
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def summary(latencies, ops, mongo_seconds):
+    latencies = sorted(latencies)
+    return {
+        "turns": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.5) * 1e3, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1e3, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1e3, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1e3, 3),
+        "mongo_ops_per_turn": round(sum(ops) / len(ops), 2),
+        "mongo_ms_per_turn": round(sum(mongo_seconds) / len(mongo_seconds) * 1e3, 3),
+    }
+
+
+# ---------- WORKER (one catalogue size per process) ----------
+class OpCounter:
+    """Mongo operations sent from the benchmark (request) thread, and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.thread = threading.get_ident()
+        self._depth = threading.local()
+
+    def wrap(self, fn):
+        counter = self
+
+        def wrapper(*args, **kwargs):
+            # Count the outermost call only; mongomock methods call each other
+            depth = getattr(counter._depth, "value", 0)
+            if depth or threading.get_ident() != counter.thread:
+                return fn(*args, **kwargs)
+            counter.count += 1
+            counter._depth.value = 1
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                counter.seconds += time.perf_counter() - start
+                counter._depth.value = 0
+        return wrapper
+
+    def listener(self):
+        from pymongo import monitoring
+        counter = self
+
+        class Listener(monitoring.CommandListener):
+            def started(self, event):
+                if threading.get_ident() == counter.thread:
+                    counter.count += 1
+
+            def succeeded(self, event):
+                if threading.get_ident() == counter.thread:
+                    counter.seconds += event.duration_micros / 1e6
+
+            def failed(self, event):
+                self.succeeded(event)
+        return Listener()
+
+
+def mongomock_client(counter=None):
+    import mongomock
+    import mongomock.collection
+    from pymongo import ReturnDocument
+
+    Collection = mongomock.collection.Collection
+
+    # mongomock rejects the sort= pymongo passes to UpdateOne in bulk_write
+    add_update = mongomock.collection.BulkOperationBuilder.add_update
+
+    def add_update_without_sort(self, *args, sort=None, **kwargs):
+        return add_update(self, *args, **kwargs)
+    mongomock.collection.BulkOperationBuilder.add_update = add_update_without_sort
+
+    # and resolves a positional "$" against {_id} only in find_one_and_update
+    def find_one_and_update(self, filter, update, projection=None, upsert=False,
+                            return_document=ReturnDocument.BEFORE, **kwargs):
+        doc = self.find_one(filter)
+        if doc is None:
+            return None
+        self.update_one(dict(filter, _id=doc["_id"]), update)
+        return self.find_one({"_id": doc["_id"]}) if return_document == ReturnDocument.AFTER else doc
+    Collection.find_one_and_update = find_one_and_update
+
+    if counter is not None:
+        for name in MONGO_METHODS:
+            setattr(Collection, name, counter.wrap(getattr(Collection, name)))
+    return mongomock.MongoClient()
+
+
+def worker(args):
+    os.environ.setdefault("CATALOGUE_POLL_SECONDS", "86400")
+    counter = OpCounter()
+    rng = random.Random(args.seed)
+    medicines, uses = seeded(args.size, rng)
+
+    if args.mongo_uri:
+        from pymongo import MongoClient, monitoring, uri_parser
+        database = uri_parser.parse_uri(args.mongo_uri)["database"] or ""
+        if "bench" not in database:
+            sys.exit(f"refusing to reseed database {database!r}: its name must contain 'bench'")
+        os.environ["MONGO_URI"] = args.mongo_uri
+        monitoring.register(counter.listener())
+        db = MongoClient(args.mongo_uri)[database]
+        for name in ("medicines", "sessions", "chats"):
+            db.drop_collection(name)
+    else:
+        import flask_pymongo
+        os.environ["MONGO_URI"] = "mongodb://localhost:27017/bench"
+        client = mongomock_client(counter)
+        flask_pymongo.MongoClient = lambda *a, **kw: client
+        db = client.bench
+
+    start = time.perf_counter()
+    for i in range(0, len(medicines), 10000):
+        db.medicines.insert_many(medicines[i:i + 10000])
+    seed_seconds = time.perf_counter() - start
+
+    os.chdir(CHATBOT)
+    start = time.perf_counter()
+    import app
+    app.warm_up.start()
+    while not (app.warm_up.ready() and app.warm_up.finished_at):
+        if time.perf_counter() - start > args.ready_timeout:
+            sys.exit(f"not ready after {args.ready_timeout}s: {app.warm_up.stats()}")
+        time.sleep(0.05)
+    ready_seconds = time.perf_counter() - start
+
+    names = [m["name"] for m in medicines]
+    script = conversation(rng, names, uses, args.sessions, args.warmup + args.turns)
+    client = app.app.test_client()
+    latencies = {kind: [] for kind in KINDS}
+    ops = {kind: [] for kind in KINDS}
+    mongo_seconds = {kind: [] for kind in KINDS}
+    errors = {}
+    started = None
+    for n, (kind, session_id, message) in enumerate(script):
+        if n == args.warmup:
+            started = time.perf_counter()
+        before, before_seconds = counter.count, counter.seconds
+        t0 = time.perf_counter()
+        r = client.post("/chat", json={"message": message}, headers={"X-Session-Id": session_id})
+        elapsed = time.perf_counter() - t0
+        if r.status_code != 200:
+            errors[r.status_code] = errors.get(r.status_code, 0) + 1
+        if n >= args.warmup:
+            latencies[kind].append(elapsed)
+            ops[kind].append(counter.count - before)
+            mongo_seconds[kind].append(counter.seconds - before_seconds)
+    seconds = time.perf_counter() - started
+
+    def every(values):
+        return [x for kind in KINDS for x in values[kind]]
+
+    result = {
+        "size": args.size,
+        "seed_seconds": round(seed_seconds, 3),
+        "ready_seconds": round(ready_seconds, 3),
+        "seconds": round(seconds, 3),
+        "turns_per_second": round(len(every(latencies)) / seconds, 1),
+        "errors": errors,
+        "all": summary(every(latencies), every(ops), every(mongo_seconds)),
+        "kinds": {kind: summary(latencies[kind], ops[kind], mongo_seconds[kind])
+                  for kind in KINDS if latencies[kind]},
+    }
+    with open(args.result, "w") as f:
+        json.dump(result, f)
+
+
+# ---------- DRIVER ----------
+def run_size(size, args):
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        path = f.name
+    command = [sys.executable, os.path.abspath(__file__), "--worker", str(size), "--result", path,
+               "--turns", str(args.turns), "--warmup", str(args.warmup), "--sessions", str(args.sessions),
+               "--seed", str(args.seed), "--ready-timeout", str(args.ready_timeout)]
+    if args.mongo_uri:
+        command += ["--mongo-uri", args.mongo_uri]
+    # Same set iteration order (and so the same replies) on every run
+    env = dict(os.environ, PYTHONHASHSEED="0")
+    try:
+        proc = subprocess.run(command, env=env, stdout=None if args.verbose else subprocess.PIPE,
+                              stderr=subprocess.STDOUT, text=True)
+        if proc.returncode:
+            print(proc.stdout or "")
+            sys.exit(f"{size} medicines: worker failed ({proc.returncode})")
+        with open(path) as f:
+            return json.load(f)
+    finally:
+        os.unlink(path)
+
+
+def change(new, old):
+    if not old:
+        return ""
+    return f" ({(new - old) / old * 100:+6.1f}%)"
+
+
+def report(result, baseline):
+    old = baseline or {"all": {}, "kinds": {}}
+    print(
+        f"{result['size']} medicines | seed {result['seed_seconds']:6.1f}s | ready {result['ready_seconds']:6.1f}s | "
+        f"{result['turns_per_second']:8.1f} turns/s{change(result['turns_per_second'], old.get('turns_per_second'))}"
+    )
+    rows = [("all", result["all"], old["all"])]
+    rows += [(kind, stats, old["kinds"].get(kind, {})) for kind, stats in result["kinds"].items()]
+    for kind, stats, before in rows:
+        print(
+            f"  {kind:<12} {stats['turns']:6d} | "
+            + " | ".join(f"{p} {stats[p + '_ms']:7.2f} ms{change(stats[p + '_ms'], before.get(p + '_ms'))}"
+                         for p in ("p50", "p95", "p99"))
+            + f" | mongo ops {stats['mongo_ops_per_turn']:5.2f}{change(stats['mongo_ops_per_turn'], before.get('mongo_ops_per_turn'))}"
+            + f" in {stats['mongo_ms_per_turn']:7.2f} ms"
+        )
+    if result["errors"]:
+        print(f"  errors: {result['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=100, help="turns replayed first and not counted")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo-uri", help="real mongod instead of mongomock; database name must contain 'bench'")
+    parser.add_argument("--ready-timeout", type=float, default=600)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file from an earlier --save")
+    parser.add_argument("--verbose", action="store_true", help="show the app's output")
+    parser.add_argument("--worker", type=int, dest="size", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.size:
+        worker(args)
+        return
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {r["size"]: r for r in json.load(f)["results"]}
+    results = []
+    for size in args.sizes:
+        result = run_size(size, args)
+        report(result, baseline.get(size))
+        results.append(result)
+    if args.save:
+        config = {k: getattr(args, k) for k in ("turns", "warmup", "sessions", "seed")}
+        config.update(stand_in="mongod" if args.mongo_uri else "mongomock",
+                      python=platform.python_version(), machine=platform.machine())
+        with open(args.save, "w") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+        print(f"saved {args.save}")
+
+
+if __name__ == "__main__":
+    main()
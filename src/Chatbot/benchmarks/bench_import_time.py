@@ -0,0 +1,100 @@
+"""
+Cold start: time to import app.py, and time until the warm-up is ready.
+
+    MONGO_URI=mongodb://localhost:27017/medicine_test \\
+        python benchmarks/bench_import_time.py [--runs 5] [--top 15]
+
+Every run is a fresh interpreter, as for a new autoscaled instance or
+gunicorn worker. "import" is how long ``import app`` blocks (the time
+before a worker can accept requests); "ready" is how long until /readyz
+would answer 200 (catalogue, matchers and symptom index loaded by the
+background warm-up). app.py needs MONGO_URI to import at all; pointed at
+a server that is down, the import time should stay the same. The slowest
+modules app.py imports come from ``python -X importtime``.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+CHATBOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RESULT = re.compile(r"RESULT (\S+) (\S+)")
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+ready = None
+while time.perf_counter() - imported < {timeout}:
+    if app.warm_up.ready():
+        ready = time.perf_counter()
+        break
+    time.sleep(0.005)
+# One write, so warm-up thread output can't land inside the line
+sys.stdout.write(f"RESULT {{imported - start}} {{ready - start if ready else -1}}\\n")
+"""
+
+
+def run_probe(timeout):
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(timeout=timeout)],
+        cwd=CHATBOT_DIR, capture_output=True, text=True, check=True,
+    )
+    imported, ready = map(float, RESULT.search(result.stdout).groups())
+    return imported, (ready if ready >= 0 else None)
+
+
+def slowest_modules(top):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=CHATBOT_DIR, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        # A module's imports are listed (one level deeper) before the module
+        if depth == 1:
+            children.append((int(cumulative), name.strip()))
+        elif depth == 0:
+            if name.strip() == "app":
+                rows = children
+            children = []
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for readiness")
+    args = parser.parse_args()
+
+    imports, readies = [], []
+    for _ in range(args.runs):
+        imported, ready = run_probe(args.timeout)
+        imports.append(imported)
+        if ready is not None:
+            readies.append(ready)
+
+    print(f"import app   median {statistics.median(imports) * 1e3:8.1f} ms | "
+          f"min {min(imports) * 1e3:8.1f} ms | {args.runs} runs")
+    if readies:
+        print(f"ready        median {statistics.median(readies) * 1e3:8.1f} ms | "
+              f"min {min(readies) * 1e3:8.1f} ms | {len(readies)} runs")
+    else:
+        print(f"warm-up not ready within {args.timeout}s")
+
+    print("slowest imports of app.py (cumulative):")
+    for cumulative, name in slowest_modules(args.top):
+        print(f"  {cumulative / 1e3:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Catalogue change -> phrase matcher: full rebuild vs incremental update.
+
+    python benchmarks/bench_matcher_reload.py [--sizes 1000 10000 50000] [--changes 1 10 100]
+
+Catalogues are the dataset.json medicines padded with synthetic ones whose
+uses are dataset uses or new phrases made from their words. For every
+catalogue, rounds of ``--changes`` edited medicines (a use replaced, added
+or dropped) are applied one after another, as a change stream would
+deliver them, and each round is timed both as ``KeywordAutomaton.update``
+on the running automaton and as a full ``build``. After every round the
+two must find the same groups and phrases, in the same order, in messages
+that mention current, new and removed phrases.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyword_automaton import KeywordAutomaton, PhraseCounts  # noqa: E402
+from symptom_index import USE_FIELDS  # noqa: E402
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dataset.json")
+KEYWORDS = {
+    "PRICE": ["price", "cost", "mrp"],
+    "SYMPTOMS": ["fever", "pain", "cold", "cough", "headache", "have", "suffering"],
+    "ALLERGY": ["allergic", "allergy", "rash", "reaction", "hives", "itching"],
+}
+
+
+def medicine_uses(med):
+    """Same key as app.initialize_matcher passes to PhraseCounts."""
+    return tuple(map(med.get, USE_FIELDS))
+
+
+def random_use(rng, uses, words):
+    if rng.random() < 0.5:
+        return rng.choice(uses)
+    return f"{rng.choice(uses)} {rng.choice(words)}"
+
+
+def catalogue(size, rng):
+    base = json.load(open(DATASET, encoding="utf-8"))
+    uses = sorted({m[f"use{i}"] for m in base for i in range(5) if m.get(f"use{i}")})
+    words = sorted({w for use in uses for w in use.lower().split() if w.isalpha()})
+    medicines = [dict(m) for m in base[:size]]
+    while len(medicines) < size:
+        med = {"name": f"{rng.choice(base)['name']} {len(medicines)}"}
+        for i in range(rng.randint(1, 5)):
+            med[f"use{i}"] = random_use(rng, uses, words)
+        medicines.append(med)
+    for i, med in enumerate(medicines):
+        med["_id"] = i
+    return medicines, uses, words
+
+
+def edit(med, rng, uses, words):
+    current = [med[f"use{i}"] for i in range(5) if med.get(f"use{i}")]
+    r = rng.random()
+    if r < 0.4 and len(current) > 1:
+        current.pop(rng.randrange(len(current)))
+    elif r < 0.7 and len(current) < 5:
+        current.append(random_use(rng, uses, words))
+    else:
+        current[rng.randrange(len(current))] = random_use(rng, uses, words)
+    for i in range(5):
+        med.pop(f"use{i}", None)
+    for i, use in enumerate(current):
+        med[f"use{i}"] = use
+
+
+def messages(rng, phrases, gone, count):
+    pool = sorted(phrases) + sorted(gone)
+    texts = []
+    for _ in range(count):
+        parts = [rng.choice(pool) for _ in range(rng.randint(1, 3))]
+        texts.append(f"i have {' and '.join(parts)}, what is the price?")
+    return texts
+
+
+def search_all(automaton, texts):
+    return [(sorted(m.groups), m.phrases) for m in map(automaton.search, texts)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--changes", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--rounds", type=int, default=5, help="rounds per --changes value")
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    failures = 0
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        medicines, uses, words = catalogue(size, rng)
+        counts = PhraseCounts()
+        counts.diff({med["_id"]: medicine_uses(med) for med in medicines})
+        start = time.perf_counter()
+        automaton = KeywordAutomaton(KEYWORDS, counts.counts)
+        print(f"{size} medicines | {len(automaton)} phrases | initial build {(time.perf_counter() - start) * 1e3:8.1f} ms")
+
+        version = 0
+        for changes in args.changes:
+            update_s, build_s = [], []
+            for _ in range(args.rounds):
+                version += 1
+                for med in rng.sample(medicines, changes):
+                    edit(med, rng, uses, words)
+                start = time.perf_counter()
+                added, removed = counts.diff({med["_id"]: medicine_uses(med) for med in medicines})
+                diff_s = time.perf_counter() - start
+                start = time.perf_counter()
+                automaton.update(added, removed, version=version)
+                update_s.append(diff_s + time.perf_counter() - start)
+
+                start = time.perf_counter()
+                rebuilt = KeywordAutomaton(KEYWORDS, counts.counts)
+                build_s.append(time.perf_counter() - start)
+
+                texts = messages(rng, counts.counts, removed, args.messages)
+                if len(automaton) != len(rebuilt) or search_all(automaton, texts) != search_all(rebuilt, texts):
+                    failures += 1
+                    print(f"  MISMATCH after version {version} (+{len(added)} -{len(removed)})")
+
+            stats = automaton.stats()
+            print(
+                f"  {changes:4d} changed | update {sum(update_s) / len(update_s) * 1e3:8.2f} ms | "
+                f"full build {sum(build_s) / len(build_s) * 1e3:8.2f} ms | "
+                f"delta {stats['delta_phrases']} hidden {stats['hidden_phrases']} | builds {stats['builds']}"
+            )
+    print(f"mismatches {failures}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Memory held per worker for the catalogue: driver dicts vs MedicineRecord.
+
+    python benchmarks/bench_medicine_memory.py [--sizes 10000 100000]
+
+Catalogues are the dataset.json medicines padded with synthetic ones that
+reuse their fields under new names. Every document is decoded from its
+own JSON text, so like documents from the driver none of them share
+string objects. Measured with tracemalloc, per 10k medicines:
+
+- full documents, as ``find({})`` returns them
+- projected dicts, as ``find({}, PROJECTION)`` returns them (what the
+  catalogue snapshot used to keep)
+- the symptom index's per-medicine entry dicts, which it used to build
+  next to the snapshot and now replaces with references to the records
+- MedicineRecords built from the projected dicts, once those are gone
+
+Field reads are timed too, since a record's ``get`` does more than a dict's.
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from medicine_catalogue import PROJECTION, MedicineRecord  # noqa: E402
+from symptom_index import medicine_uses  # noqa: E402
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dataset.json")
+
+
+def documents(size, rng):
+    """JSON text of ``size`` full medicine documents."""
+    base = json.load(open(DATASET, encoding="utf-8"))
+    texts = []
+    for i in range(size):
+        doc = dict(base[i] if i < len(base) else rng.choice(base))
+        if i >= len(base):
+            doc["name"] = f"{doc['name']} {i}"
+        texts.append(json.dumps(doc))
+    return texts
+
+
+def decode(texts, projection=None):
+    docs = []
+    for i, text in enumerate(texts):
+        doc = json.loads(text)
+        if projection:
+            doc = {k: v for k, v in doc.items() if k in projection}
+        doc["_id"] = ObjectId("%024x" % (i + 1))
+        docs.append(doc)
+    return docs
+
+
+def old_index_entries(medicines):
+    """What SymptomIndex.build kept per in-stock medicine before records."""
+    entries = []
+    for med in medicines:
+        uses = medicine_uses(med)
+        if med.get("in_stock") is True and uses:
+            entries.append({
+                "name": med["name"],
+                "dosage": med.get("dosage", ""),
+                "price": med.get("price"),
+                "delivery_time": med.get("delivery_time", ""),
+                "uses": uses,
+                "all_uses": " ".join(uses).lower(),
+            })
+    return entries
+
+
+def traced(build):
+    """Bytes still allocated after ``build()``, and its result."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return current, result
+
+
+def records_only(texts):
+    docs = decode(texts, PROJECTION)
+    records = [MedicineRecord(doc) for doc in docs]
+    del docs
+    return records
+
+
+def read_ns(medicines, repeat=5):
+    fields = ["name", "price", "dosage", "delivery_time", "use0", "use3", "in_stock"]
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for med in medicines:
+            for field in fields:
+                med.get(field)
+        best = min(best, time.perf_counter() - start)
+    return best / (len(medicines) * len(fields)) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        texts = documents(size, random.Random(args.seed))
+        per_10k = 10000 / size / 2 ** 20
+
+        full, _ = traced(lambda: decode(texts))
+        projected, dicts = traced(lambda: decode(texts, PROJECTION))
+        entries, _ = traced(lambda: old_index_entries(dicts))
+        compact, records = traced(lambda: records_only(texts))
+
+        print(f"{size} medicines (MB per 10k)")
+        print(f"  full documents      {full * per_10k:8.2f}")
+        print(f"  projected dicts     {projected * per_10k:8.2f}")
+        print(f"  + old index entries {entries * per_10k:8.2f}  (now shared with the records)")
+        print(f"  MedicineRecord      {compact * per_10k:8.2f}  | "
+              f"{projected / compact:4.1f}x smaller than projected dicts, "
+              f"{(projected + entries) / compact:4.1f}x with the old index entries")
+        print(f"  field read          dict {read_ns(dicts):6.1f} ns | record {read_ns(records):6.1f} ns")
+
+
+if __name__ == "__main__":
+    main()
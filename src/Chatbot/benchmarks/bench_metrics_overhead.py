@@ -0,0 +1,88 @@
+"""
+What the /chat instrumentation costs per message, disabled and enabled.
+
+    python benchmarks/bench_metrics_overhead.py [--messages 200000]
+
+Replays the instrumentation one /chat message goes through (request begin
+and end, the session_load span, the message span with its intent, six
+decorated stages and the medicine mention span, two Mongo command events)
+around empty stage functions, so only the instrumentation is timed. The
+baseline calls the same empty functions bare.
+"""
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_metrics import ChatMetrics  # noqa: E402
+
+STAGES = ["detect_intent", "handle_cart_chat", "medicine_details",
+          "extract_symptoms", "find_medicines", "save_chat_turn"]
+EVENT = SimpleNamespace(command_name="find")
+
+
+def stage():
+    return None
+
+
+def pipeline(metrics):
+    stages = [metrics.timed(name)(stage) for name in STAGES]
+    listeners = metrics.event_listeners()
+
+    def message():
+        token = metrics.begin("chat")
+        with metrics.span("session_load"):
+            for listener in listeners:
+                listener.started(EVENT)
+        with metrics.message():
+            metrics.set_intent("SYMPTOMS")
+            with metrics.span("medicine_mention"):
+                stage()
+            for fn in stages:
+                fn()
+            for listener in listeners:
+                listener.started(EVENT)
+        metrics.end(token)
+    return message
+
+
+def bare():
+    stage()
+    for _ in STAGES:
+        stage()
+
+
+def timed(fn, count, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(count):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200000)
+    args = parser.parse_args()
+
+    base = timed(bare, args.messages)
+    disabled = timed(pipeline(ChatMetrics(enabled=False)), args.messages)
+    enabled_metrics = ChatMetrics(enabled=True)
+    enabled = timed(pipeline(enabled_metrics), args.messages)
+    start = time.perf_counter()
+    size = len(enabled_metrics.render())
+    render_ms = (time.perf_counter() - start) * 1e3
+
+    print(f"bare stages        {base * 1e6:7.2f} us/msg")
+    print(f"metrics disabled   {disabled * 1e6:7.2f} us/msg | overhead {(disabled - base) * 1e6:6.2f} us")
+    print(f"metrics enabled    {enabled * 1e6:7.2f} us/msg | overhead {(enabled - base) * 1e6:6.2f} us")
+    print(f"/metrics render    {render_ms:7.2f} ms ({size} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Compare NameMatcher against the old ``process.extract`` scan.
+
+    python benchmarks/bench_name_matcher.py [--sizes 100 10000 100000]
+
+Names are the dataset.json medicines padded with synthetic variants; the
+script reports per-message latency for both paths and any disagreement in
+the matches above the 80 threshold.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fuzzywuzzy import process  # noqa: E402
+
+from name_matcher import MATCH_THRESHOLD, NameMatcher  # noqa: E402
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dataset.json")
+
+MESSAGES = [
+    "add to cart {name}",
+    "what is the price of {name}",
+    "tell me about {name}",
+    "dosage of {name} for adults",
+    "I have a headache and fever",
+    "add to cart {typo} please",
+    "side effects",
+]
+
+
+def synthetic_names(size, rng):
+    base = [m["name"] for m in json.load(open(DATASET, encoding="utf-8"))]
+    names = list(base[:size])
+    forms = ["Tablet", "Syrup", "Forte", "SR", "Plus", "XR", "Gel", "Capsule"]
+    while len(names) < size:
+        stem = rng.choice(base).split()[0]
+        names.append(f"{stem}{rng.choice(['', 'x', 'o', 'in'])} {rng.choice(forms)} {rng.randint(5, 1000)}mg")
+    return names
+
+
+def typo(name, rng):
+    if len(name) < 4:
+        return name
+    i = rng.randrange(1, len(name) - 1)
+    return name[:i] + name[i + 1:]
+
+
+def old_path(message, names, limit):
+    return [m for m in process.extract(message, names, limit=limit) if m[1] > MATCH_THRESHOLD]
+
+
+def run(size, queries, rng):
+    names = synthetic_names(size, rng)
+    start = time.perf_counter()
+    matcher = NameMatcher(names)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    messages = []
+    for _ in range(queries):
+        name = rng.choice(names)
+        messages.append(rng.choice(MESSAGES).format(name=name, typo=typo(name, rng)))
+
+    old_s = new_s = 0.0
+    mismatches = 0
+    for message in messages:
+        for limit in (1, 5):
+            t0 = time.perf_counter()
+            expected = old_path(message, names, limit)
+            t1 = time.perf_counter()
+            actual = matcher.extract(message, limit=limit)
+            t2 = time.perf_counter()
+            old_s += t1 - t0
+            new_s += t2 - t1
+            if expected != actual:
+                mismatches += 1
+                print(f"  mismatch for {message!r}: {expected} != {actual}")
+
+    calls = queries * 2
+    print(
+        f"{size:>7} names | build {build_ms:8.1f} ms | "
+        f"process.extract {old_s / calls * 1000:9.3f} ms/msg | "
+        f"NameMatcher {new_s / calls * 1000:7.3f} ms/msg | "
+        f"speedup {old_s / new_s if new_s else float('inf'):6.1f}x | mismatches {mismatches}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for size in args.sizes:
+        # The old path is O(N) per message, keep 100k runs bearable
+        queries = args.queries if size <= 10000 else max(3, args.queries // 4)
+        run(size, queries, rng)
+
+
+if __name__ == "__main__":
+    main()
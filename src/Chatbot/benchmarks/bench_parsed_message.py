@@ -0,0 +1,122 @@
+"""
+Per-message preprocessing cost: old per-stage parsing vs ParsedMessage.
+
+    pip install nltk spacy   # the old path still uses them
+    python benchmarks/bench_parsed_message.py [--messages 2000]
+
+The old path repeats what each /chat stage used to do on the raw text
+(lower-casing in intent detection, cart handling, the checkout and allergy
+checks, text_to_int, plus the spaCy and NLTK passes in symptom extraction).
+Without the punkt data installed, NLTK's untrained Punkt is used for the
+sentence split, as in tokenizer_parity.py.
+The new path builds one ParsedMessage and reads the same values from it,
+keywords and phrases coming from one KeywordAutomaton pass. Both paths must
+produce identical stage inputs; disagreements are reported.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import spacy  # noqa: E402
+from spacy.matcher import PhraseMatcher  # noqa: E402
+from tokenizer_parity import reference_tokenizer  # noqa: E402
+
+from keyword_automaton import KeywordAutomaton  # noqa: E402
+from parsed_message import ParsedMessage, text_to_int  # noqa: E402
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dataset.json")
+
+MESSAGES = [
+    "I have fever and headache",
+    "I am suffering from acidity and stomach pain since yesterday",
+    "what is the price of {name}",
+    "tell me about {name}",
+    "add to cart {name}",
+    "two",
+    "3 please",
+    "I get a rash and itching, allergy maybe",
+    "proceed to checkout",
+    "My child has a cold, cough and a mild fever, what should I take?",
+]
+CHECKS = ["add", "price", "dosage", "side effect", "precaution", "delivery", "about", "fever"]
+ALLERGY = ["allergic", "allergy", "rash", "reaction", "hives", "itching"]
+
+
+def build_matcher(nlp):
+    medicines = json.load(open(DATASET, encoding="utf-8"))
+    phrases = {m[f"use{i}"].lower() for m in medicines for i in range(5) if m.get(f"use{i}")}
+    matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
+    matcher.add("MED_USE", [nlp.make_doc(p) for p in phrases])
+    keywords = {check: [check] for check in CHECKS}
+    keywords["ALLERGY"] = ALLERGY
+    return [m["name"] for m in medicines], matcher, KeywordAutomaton(keywords, phrases)
+
+
+def old_path(message, nlp, matcher, tokenize):
+    intent_hits = [x in message.lower() for x in CHECKS]
+    cart = "add to cart" in message.lower()
+    number = text_to_int(message)
+    checkout = "proceed to checkout" in message.lower()
+    doc = nlp(message.lower())
+    phrases = sorted({doc[start:end].text.strip() for match_id, start, end in matcher(doc)})
+    tokens = tokenize(message.lower())
+    words = [w for w in tokens if re.match(r'^[a-z]{3,15}$', w) and len(w) > 2]
+    allergy = any(k in message.lower() for k in ALLERGY)
+    return intent_hits, cart, number, checkout, phrases, words, allergy
+
+
+def new_path(message, automaton):
+    parsed = ParsedMessage(message, automaton)
+    intent_hits = [x in parsed.keywords for x in CHECKS]
+    cart = "add to cart" in parsed.lower
+    number = parsed.number
+    checkout = "proceed to checkout" in parsed.lower
+    allergy = "ALLERGY" in parsed.keywords
+    return intent_hits, cart, number, checkout, sorted(set(parsed.phrases)), parsed.words, allergy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    nlp = spacy.blank("en")
+    names, matcher, automaton = build_matcher(nlp)
+    tokenize = reference_tokenizer()
+    messages = [rng.choice(MESSAGES).format(name=rng.choice(names)) for _ in range(args.messages)]
+
+    # Warm up spaCy's and NLTK's lazy loading outside the timings
+    old_path(messages[0], nlp, matcher, tokenize)
+    new_path(messages[0], automaton)
+
+    # Best of --repeat interleaved runs, to keep scheduler noise out
+    old_s = new_s = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        old = [old_path(m, nlp, matcher, tokenize) for m in messages]
+        old_s = min(old_s, time.perf_counter() - start)
+        start = time.perf_counter()
+        new = [new_path(m, automaton) for m in messages]
+        new_s = min(new_s, time.perf_counter() - start)
+
+    mismatches = sum(1 for a, b in zip(old, new) if a != b)
+    per_old = old_s / len(messages) * 1e6
+    per_new = new_s / len(messages) * 1e6
+    print(
+        f"{len(messages)} messages | per-stage parsing {per_old:8.1f} us/msg | "
+        f"ParsedMessage {per_new:8.1f} us/msg | saved {per_old - per_new:7.1f} us/msg | "
+        f"mismatches {mismatches}"
+    )
+
+
+if __name__ == "__main__":
+    main()
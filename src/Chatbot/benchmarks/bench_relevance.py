@@ -0,0 +1,75 @@
+"""
+Fuzzy part of calculate_relevance: per-pair fuzz.partial_ratio vs partial_ratios.
+
+    python benchmarks/bench_relevance.py [--symptoms 500]
+
+Scores symptoms (use phrases, their words and typos from dataset.json)
+against every medicine both ways: the old calculate_relevance joined and
+lower-cased the uses and called ``fuzz.partial_ratio`` per pair, the new one
+gets the index's precomputed ``all_uses`` strings and scores them with one
+``partial_ratios`` call. The rest of the score is unchanged arithmetic on
+the same strings. Any fuzzy score that differs is reported.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fuzzywuzzy import fuzz  # noqa: E402
+
+from symptom_index import medicine_uses, partial_ratios  # noqa: E402
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dataset.json")
+
+
+def typo(word, rng):
+    if len(word) < 4:
+        return word + word[-1]
+    i = rng.randrange(1, len(word) - 1)
+    return word[:i] + word[i + 1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--symptoms", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    uses = [medicine_uses(m) for m in json.load(open(DATASET, encoding="utf-8"))]
+    uses = [u for u in uses if u]
+    all_uses = [" ".join(u).lower() for u in uses]
+    phrases = sorted({use.lower() for u in uses for use in u})
+    words = sorted({w for phrase in phrases for w in phrase.split()})
+    pool = phrases + words + [typo(w, rng) for w in words]
+    symptoms = [rng.choice(pool) for _ in range(args.symptoms)]
+
+    start = time.perf_counter()
+    old = [[fuzz.partial_ratio(s, ' '.join(u).lower()) for u in uses] for s in symptoms]
+    old_s = time.perf_counter() - start
+    start = time.perf_counter()
+    new = [partial_ratios(s, all_uses) for s in symptoms]
+    new_s = time.perf_counter() - start
+
+    mismatches = 0
+    for symptom, a, b in zip(symptoms, old, new):
+        for u, x, y in zip(all_uses, a, b):
+            if x != y:
+                mismatches += 1
+                if mismatches <= 10:
+                    print(f"{symptom!r} vs {u!r}: old {x} new {y}")
+
+    pairs = len(symptoms) * len(uses)
+    print(
+        f"{pairs} pairs | per-pair {old_s / pairs * 1e6:6.2f} us | batched {new_s / pairs * 1e6:6.2f} us | "
+        f"{old_s / new_s:4.1f}x | mismatches {mismatches}"
+    )
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Rank medicines for a message: old dict/sort/dedupe scan vs SymptomIndex.rank.
+
+    python benchmarks/bench_symptom_ranking.py [--sizes 1000 10000 50000]
+
+Catalogues are the dataset.json medicines padded with synthetic ones that
+reuse their names and uses. Every message's symptoms are scored once up
+front (that is the cold, cached-per-symptom cost); the timed part is what
+runs on each /chat message afterwards: averaging, the > 20 filter, sorting,
+one medicine per name and the top 5. Both paths must return the same
+medicines with the same scores.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from symptom_index import SymptomIndex, medicine_uses, partial_ratios  # noqa: E402
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dataset.json")
+
+
+def relevance(symptom, all_uses_list):
+    """Same scoring as app.calculate_relevance."""
+    stem = symptom.rstrip('s')
+    scores = []
+    for all_uses, fuzzy in zip(all_uses_list, partial_ratios(symptom, all_uses_list)):
+        score = 100 if symptom in all_uses else 0
+        if fuzzy >= 85:
+            score += fuzzy
+        elif fuzzy >= 70:
+            score += fuzzy * 0.5
+        if stem in all_uses:
+            score += 60
+        scores.append(score)
+    return scores
+
+
+def catalogue(size, rng):
+    base = [m for m in json.load(open(DATASET, encoding="utf-8")) if medicine_uses(m)]
+    uses = sorted({use for m in base for use in medicine_uses(m)})
+    medicines = [dict(m, in_stock=True) for m in base[:size]]
+    while len(medicines) < size:
+        med = {"name": f"{rng.choice(base)['name']} {rng.randint(1, size // 10 + 1)}", "in_stock": True}
+        for i, use in enumerate(rng.sample(uses, rng.randint(1, 5))):
+            med[f"use{i}"] = use
+        medicines.append(med)
+    return medicines
+
+
+def old_rank(snapshot, symptoms):
+    totals = {}
+    for symptom in symptoms:
+        positions, relevances = snapshot.postings[symptom]
+        for pos, rel in zip(positions.tolist(), relevances.tolist()):
+            total, count = totals.get(pos, (0, 0))
+            totals[pos] = (total + rel, count + 1)
+    scored = [(snapshot.entries[pos], total / count) for pos, (total, count) in sorted(totals.items())]
+    scored.sort(key=lambda x: x[1], reverse=True)
+    seen = set()
+    final = []
+    for med, score in scored:
+        if med["name"] not in seen:
+            seen.add(med["name"])
+            final.append((med, score))
+            if len(final) == 5:
+                break
+    return final
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        index = SymptomIndex()
+        index.build(catalogue(size, rng))
+        snapshot = index._snapshot
+        words = sorted({w for all_uses in snapshot.all_uses[:200] for w in all_uses.split() if len(w) > 3})
+        vocab = rng.sample(words, min(30, len(words))) + ["feverr", "stomach pain", "acidity"]
+        messages = [rng.sample(vocab, rng.randint(1, 4)) for _ in range(args.messages)]
+
+        start = time.perf_counter()
+        for symptom in vocab:
+            snapshot.row(symptom, relevance)
+        cold_s = (time.perf_counter() - start) / len(vocab)
+
+        start = time.perf_counter()
+        old = [old_rank(snapshot, m) for m in messages]
+        old_s = (time.perf_counter() - start) / len(messages)
+        start = time.perf_counter()
+        new = [index.rank(m, relevance) for m in messages]
+        new_s = (time.perf_counter() - start) / len(messages)
+
+        mismatches = sum(
+            1 for a, b in zip(old, new)
+            if [(m["name"], s) for m, s in a] != [(m["name"], s) for m, s in b]
+        )
+        print(
+            f"{size:>6} medicines | first use of a symptom {cold_s * 1e3:8.1f} ms | "
+            f"per message: old {old_s * 1e3:7.3f} ms, rank {new_s * 1e3:7.3f} ms | mismatches {mismatches}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Hammer one session's cart from many threads and check nothing is lost.
+
+    MONGO_URI=mongodb://localhost:27017/medicine_test \\
+        python benchmarks/cart_concurrency.py [--threads 16] [--adds 25]
+
+Every thread adds the same medicines through /api/cart/add, so the first
+adds race to create the line items and the rest race to bump quantities.
+With the old read-modify-write cart, quantities came up short; now each
+medicine must end up as one line item with ``threads * adds`` units.
+Needs a real MongoDB; the session used is removed again afterwards.
+tests/test_cart_updates.py replays the same races on mongomock.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, mongo  # noqa: E402
+
+
+def hammer(session_id, medicines, adds, errors):
+    client = app.test_client()
+    for _ in range(adds):
+        for name in medicines:
+            r = client.post(
+                "/api/cart/add",
+                json={"name": name, "quantity": 1},
+                headers={"X-Session-Id": session_id},
+            )
+            if r.status_code != 200:
+                errors.append(f"{name}: HTTP {r.status_code} {r.get_data(as_text=True)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--adds", type=int, default=25)
+    parser.add_argument("--medicines", nargs="+", default=["Dolo650", "Cetrizine", "Omeprazole"])
+    args = parser.parse_args()
+
+    session_id = f"cart-concurrency-{uuid.uuid4().hex}"
+    errors = []
+    threads = [
+        threading.Thread(target=hammer, args=(session_id, args.medicines, args.adds, errors))
+        for _ in range(args.threads)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        session = mongo.db.sessions.find_one({"session_id": session_id}) or {}
+        mongo.db.sessions.delete_many({"session_id": session_id})
+
+    expected = args.threads * args.adds
+    cart = session.get("cart", [])
+    ok = not errors
+    for name in args.medicines:
+        items = [item for item in cart if item["name"].lower() == name.lower()]
+        quantity = sum(item["quantity"] for item in items)
+        print(f"{name:>12}: {len(items)} line item(s), quantity {quantity} (expected {expected})")
+        ok = ok and len(items) == 1 and quantity == expected
+
+    total = args.threads * args.adds * len(args.medicines)
+    print(f"{total} adds from {args.threads} threads in {elapsed:.2f}s")
+    for error in errors[:10]:
+        print(f"  {error}")
+    print("OK" if ok else "LOST UPDATES")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Closed-loop load test against a running chatbot deployment.
+
+    pip install httpx
+    python benchmarks/load_test.py --url http://localhost:5000 [--concurrency 64] [--duration 30]
+
+Start the deployment to compare first, each on the same MONGO_URI:
+
+    python app.py                                         # Flask dev server (app.run)
+    gunicorn -w 4 --threads 8 -b 0.0.0.0:5000 app:app     # gunicorn, sync workers
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+
+or, without a MongoDB, ``benchmarks/serve_stand_in.py`` (mongomock).
+
+``--concurrency`` clients each send a /chat message from their own session,
+wait for the reply and send the next one; every ``--cart-every``-th request
+is a /api/cart read instead. Reported are throughput and latency
+percentiles per route, and non-200 responses. Every run adds chat turns and
+sessions (``load-test-*``) to the database it hits.
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+
+import httpx
+
+MESSAGES = [
+    "I have fever and headache",
+    "I am suffering from acidity and stomach pain since yesterday",
+    "I have cough and cold",
+    "body pain and muscle pain",
+    "what is the price of Dolo650",
+    "tell me about Cetrizine",
+    "I get a rash and itching, allergy maybe",
+    "vomiting",
+]
+
+
+async def client_loop(client, session_id, deadline, args, rng, latencies, errors):
+    sent = 0
+    while time.perf_counter() < deadline:
+        sent += 1
+        headers = {"X-Session-Id": session_id}
+        start = time.perf_counter()
+        try:
+            if args.cart_every and sent % args.cart_every == 0:
+                route = "/api/cart"
+                r = await client.get(route, headers=headers)
+            else:
+                route = "/chat"
+                r = await client.post(route, json={"message": rng.choice(MESSAGES)}, headers=headers)
+            status = r.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        latencies.setdefault(route, []).append(time.perf_counter() - start)
+        if status != 200:
+            errors[status] = errors.get(status, 0) + 1
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        r = await client.get("/")
+        r.raise_for_status()
+
+        run_id = uuid.uuid4().hex[:8]
+        latencies = {}
+        errors = {}
+        deadline = time.perf_counter() + args.warmup
+        # Warm-up requests are sent but not counted
+        await asyncio.gather(*(
+            client_loop(client, f"load-test-{run_id}-{i}", deadline, args, rng, {}, {})
+            for i in range(args.concurrency)
+        ))
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(
+            client_loop(client, f"load-test-{run_id}-{i}", deadline, args, rng, latencies, errors)
+            for i in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"{args.url} | {args.concurrency} clients | {elapsed:.1f}s | {total / elapsed:8.1f} req/s")
+    for route, values in sorted(latencies.items()):
+        values.sort()
+        print(
+            f"  {route:<10} {len(values):7d} req | p50 {percentile(values, 0.5) * 1e3:7.1f} ms | "
+            f"p90 {percentile(values, 0.9) * 1e3:7.1f} ms | p99 {percentile(values, 0.99) * 1e3:7.1f} ms"
+        )
+    if errors:
+        print(f"  errors: {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--cart-every", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
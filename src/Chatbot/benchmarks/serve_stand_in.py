@@ -0,0 +1,89 @@
+"""
+Serve the Flask or ASGI app on an in-memory Mongo stand-in, for load_test.py.
+
+    pip install mongomock mongomock-motor
+    python benchmarks/serve_stand_in.py flask [--port 5000] [--size 1000]
+    python benchmarks/serve_stand_in.py gunicorn [--threads 8]
+    python benchmarks/serve_stand_in.py asgi
+
+Seeds a mongomock database the way bench_chat.py does, waits for the
+warm-up, then serves it from one process: "flask" is app.run's threaded
+server, "gunicorn" one gthread worker and "asgi" uvicorn, with the async
+client replaced by mongomock-motor over the same database.
+
+mongomock answers in-process with no network round trip, and under
+"asgi" it runs on the event loop, so a run compares the servers and the
+chat pipeline rather than time spent waiting on Mongo, which is where
+the async client is meant to help. Point load_test.py at deployments on a
+real MONGO_URI for that.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+from bench_chat import CHATBOT, mongomock_client, seeded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("server", choices=["flask", "gunicorn", "asgi"])
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--size", type=int, default=1000, help="medicines in the catalogue")
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn worker threads")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    import flask_pymongo
+    os.environ["MONGO_URI"] = "mongodb://localhost:27017/bench"
+    os.environ.setdefault("CATALOGUE_POLL_SECONDS", "86400")
+    client = mongomock_client()
+    flask_pymongo.MongoClient = lambda *a, **kw: client
+    medicines, _ = seeded(args.size, random.Random(args.seed))
+    client.bench.medicines.insert_many(medicines)
+
+    os.chdir(CHATBOT)
+    sys.path.insert(0, CHATBOT)
+    import app
+    app.warm_up.start()
+    while not (app.warm_up.ready() and app.warm_up.finished_at):
+        time.sleep(0.05)
+    print(f"{args.size} medicines ready, serving {args.server} on port {args.port}")
+
+    if args.server == "flask":
+        app.app.run(host="127.0.0.1", port=args.port, threaded=True)
+    elif args.server == "gunicorn":
+        from gunicorn.app.base import BaseApplication
+
+        class Server(BaseApplication):
+            def load_config(self):
+                self.cfg.set("bind", f"127.0.0.1:{args.port}")
+                self.cfg.set("workers", 1)
+                self.cfg.set("threads", args.threads)
+                self.cfg.set("worker_class", "gthread")
+
+            def load(self):
+                return app.app
+        Server().run()
+    else:
+        import mongomock_motor
+        import uvicorn
+
+        import asgi
+
+        class AsyncClient(mongomock_motor.AsyncMongoMockClient):
+            def __init__(self, *args, **kwargs):
+                super().__init__(mock_mongo_client=client)
+
+            async def close(self):
+                # A coroutine on AsyncMongoClient; mongomock-motor may have none
+                close = getattr(super(), "close", None)
+                if close is not None:
+                    close()
+        asgi.AsyncMongoClient = AsyncClient
+        uvicorn.run(asgi.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
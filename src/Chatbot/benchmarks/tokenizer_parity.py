@@ -0,0 +1,108 @@
+"""
+Parity and speed check: parsed_message.word_tokenize vs nltk.word_tokenize.
+
+    pip install nltk
+    python benchmarks/tokenizer_parity.py [--variants 20000]
+
+Tokenises every name, use, description and dosage text in dataset.json, then
+random punctuation-heavy variants built from the same vocabulary, with both
+tokenizers. Symptom extraction only keeps ``[a-z]{3,15}`` tokens, so those
+are what must match; any difference is printed. Without the punkt data
+installed, NLTK's untrained Punkt is used for the sentence split.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nltk  # noqa: E402
+
+from parsed_message import word_tokenize  # noqa: E402
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dataset.json")
+FIELDS = ["name", "use0", "use1", "use2", "use3", "use4", "description", "dosage"]
+EXTRA_WORDS = (
+    "i have had don't doesn't can't cannot gonna wanna isn't patient's patients' i'm "
+    "we're you've they'll 'tis e.g. etc. 2. 3 10:30 1,000 500mg ok? yes! no... -- a/b"
+).split()
+PUNCTUATION = list(".,;:!?()[]\"'-/&*@#") + ["...", "--"]
+SYMPTOM_WORD = re.compile(r'^[a-z]{3,15}$')
+
+
+def reference_tokenizer():
+    try:
+        nltk.data.find("tokenizers/punkt")
+        return nltk.word_tokenize
+    except LookupError:
+        from nltk.tokenize import NLTKWordTokenizer
+        from nltk.tokenize.punkt import PunktSentenceTokenizer
+        sentences, words = PunktSentenceTokenizer(), NLTKWordTokenizer()
+        print("punkt data not installed, using untrained Punkt")
+        return lambda text: [w for s in sentences.tokenize(text) for w in words.tokenize(s)]
+
+
+def build_texts(variants, rng):
+    medicines = json.load(open(DATASET, encoding="utf-8"))
+    texts = [str(m[f]).lower() for m in medicines for f in FIELDS if m.get(f)]
+    vocab = [w for text in texts for w in text.split()] + EXTRA_WORDS
+    for _ in range(variants):
+        words = []
+        for _ in range(rng.randint(1, 12)):
+            word = rng.choice(vocab)
+            r = rng.random()
+            if r < 0.2:
+                word += rng.choice(PUNCTUATION)
+            elif r < 0.3:
+                word = rng.choice(PUNCTUATION) + word
+            words.append(word)
+        texts.append(rng.choice([" ", "  "]).join(words))
+    return texts
+
+
+def timed(tokenize, texts, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = [tokenize(t) for t in texts]
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--variants", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    texts = build_texts(args.variants, random.Random(args.seed))
+    reference = reference_tokenizer()
+    reference(texts[0])
+
+    expected, nltk_s = timed(reference, texts, args.repeat)
+    actual, ours_s = timed(word_tokenize, texts, args.repeat)
+
+    mismatches = 0
+    for text, a, b in zip(texts, expected, actual):
+        a = [w for w in a if SYMPTOM_WORD.match(w)]
+        b = [w for w in b if SYMPTOM_WORD.match(w)]
+        if a != b:
+            mismatches += 1
+            if mismatches <= 10:
+                print(f"{text!r}\n    nltk {a}\n    ours {b}")
+
+    print(
+        f"{len(texts)} texts | nltk {nltk_s / len(texts) * 1e6:7.1f} us/text | "
+        f"word_tokenize {ours_s / len(texts) * 1e6:7.1f} us/text | "
+        f"{nltk_s / ours_s:5.1f}x | mismatches {mismatches}"
+    )
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
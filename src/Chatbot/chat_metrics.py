@@ -0,0 +1,270 @@
+"""
+Per-stage timing and Mongo operation counts, exported in Prometheus format.
+
+Each /chat stage runs in a timing span feeding a latency histogram, every
+message is timed per intent, and a pymongo command listener counts the
+Mongo operations of each request. ``render()`` is what /metrics serves.
+
+Disabled (the default), nothing is timed or counted and no listener is
+registered. Metrics are per process: each scrape sees the worker it hit.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import nullcontext
+from functools import wraps
+
+from pymongo import monitoring
+
+# Seconds; /chat stages range from microseconds (intent) to Mongo round-trips
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+_NOOP = nullcontext()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return str(int(value))
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per bucket (not cumulative) counts, then +Inf, sum
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} histogram")
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = _labels(self.labelnames + ("le",), labels + (_number(bound),))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_text = _labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_number(values[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} counter")
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+
+
+class RequestStats:
+    """What one request has done so far."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.mongo_ops = 0
+        # (stage, seconds) in the order the spans ended
+        self.spans = []
+
+
+_current = contextvars.ContextVar("chat_metrics_request", default=None)
+_message = contextvars.ContextVar("chat_metrics_message", default=None)
+
+
+class _Span:
+    __slots__ = ("metrics", "stage", "started")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.started
+        self.metrics.stage_seconds.observe(seconds, self.stage)
+        request = _current.get()
+        if request is not None:
+            request.spans.append((self.stage, seconds))
+        return False
+
+
+class _MessageSpan:
+    """Times one chat message; the intent label is set while it runs."""
+
+    __slots__ = ("metrics", "intent", "started", "token")
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.intent = "NONE"
+
+    def __enter__(self):
+        self.token = _message.set(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.message_seconds.observe(time.perf_counter() - self.started, self.intent)
+        _message.reset(self.token)
+        return False
+
+
+class MongoCommandCounter(monitoring.CommandListener):
+    """Counts commands per name, and per request for the request that sent them."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def started(self, event):
+        self.metrics.mongo_commands.inc(event.command_name)
+        request = _current.get()
+        if request is not None:
+            request.mongo_ops += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        self.metrics.mongo_failures.inc(event.command_name)
+
+
+class ChatMetrics:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stage_seconds = Histogram(
+            "chat_stage_seconds", "Time spent in each /chat pipeline stage.", ["stage"])
+        self.message_seconds = Histogram(
+            "chat_message_seconds", "Time to answer one chat message, by detected intent.", ["intent"])
+        self.request_seconds = Histogram(
+            "http_request_seconds", "Request latency by endpoint.", ["endpoint"])
+        self.request_mongo_ops = Histogram(
+            "http_request_mongo_operations", "Mongo commands sent while serving one request.",
+            ["endpoint"], buckets=COUNT_BUCKETS)
+        self.mongo_commands = Counter(
+            "mongo_commands_total", "Mongo commands sent, background work included.", ["command"])
+        self.mongo_failures = Counter(
+            "mongo_command_failures_total", "Mongo commands that failed.", ["command"])
+        self.listener = MongoCommandCounter(self)
+        # Callables returning [(name, type, help, value)] read at scrape time
+        self.collectors = []
+
+    def event_listeners(self):
+        """For ``MongoClient(event_listeners=...)``; none while disabled."""
+        return [self.listener] if self.enabled else []
+
+    # ---------- SPANS ----------
+    def span(self, stage):
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, stage)
+
+    def timed(self, stage):
+        """Decorator form of ``span``; a no-op if disabled at import."""
+        def decorate(fn):
+            if not self.enabled:
+                return fn
+
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with _Span(self, stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def message(self):
+        """Span around one chat message, labelled by ``set_intent``."""
+        if not self.enabled:
+            return _NOOP
+        return _MessageSpan(self)
+
+    def set_intent(self, intent):
+        if self.enabled:
+            message = _message.get()
+            if message is not None:
+                message.intent = intent
+
+    # ---------- REQUESTS ----------
+    def begin(self, endpoint):
+        """Start tracking a request; returns a token for ``end``."""
+        if not self.enabled:
+            return None
+        return _current.set(RequestStats(endpoint))
+
+    def current(self):
+        return _current.get()
+
+    def end(self, token):
+        """Record the request started with ``begin`` and return its stats."""
+        if token is None:
+            return None
+        request = _current.get()
+        _current.reset(token)
+        if request is not None:
+            seconds = time.perf_counter() - request.started
+            self.request_seconds.observe(seconds, request.endpoint)
+            self.request_mongo_ops.observe(request.mongo_ops, request.endpoint)
+        return request
+
+    # ---------- EXPORT ----------
+    def render(self):
+        lines = []
+        for metric in (self.stage_seconds, self.message_seconds, self.request_seconds,
+                       self.request_mongo_ops, self.mongo_commands, self.mongo_failures):
+            metric.render(lines)
+        for collect in self.collectors:
+            try:
+                samples = collect()
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+                continue
+            for name, kind, help, value in samples:
+                if value is None:
+                    continue
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
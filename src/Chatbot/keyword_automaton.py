@@ -0,0 +1,248 @@
+"""
+Aho-Corasick automaton over every keyword and phrase /chat looks for.
+
+Intent keywords, allergy terms and the catalogue's use phrases are
+compiled into one automaton that reads the lower-cased message once and
+reports every keyword group and use phrase it contains. ``update`` puts a
+catalogue version's new phrases in a small delta automaton and hides the
+removed ones, until the delta outgrows ``max_delta`` and a full build
+folds it in. Each build or update publishes one immutable state.
+"""
+import threading
+import time
+from collections import Counter, deque
+
+
+class KeywordMatches:
+    def __init__(self):
+        # Names of the keyword groups with at least one keyword in the text
+        self.groups = set()
+        # Use phrases found as whole words, in order of where they end
+        self.phrases = []
+
+
+def compile_patterns(patterns):
+    """Goto, failure and output tables for ``(text, (length, group))`` patterns."""
+    goto = [{}]
+    output = [[]]
+    for text, pattern in patterns:
+        state = 0
+        for ch in text:
+            nxt = goto[state].get(ch)
+            if nxt is None:
+                nxt = len(goto)
+                goto[state][ch] = nxt
+                goto.append({})
+                output.append([])
+            state = nxt
+        if pattern not in output[state]:
+            output[state].append(pattern)
+
+    # Breadth first, so every failure target is finished before it is used
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for ch, nxt in goto[state].items():
+            queue.append(nxt)
+            target = fail[state]
+            while target and ch not in goto[target]:
+                target = fail[target]
+            fail[nxt] = goto[target].get(ch, 0)
+            output[nxt] = output[nxt] + output[fail[nxt]]
+
+    return goto, fail, [tuple(out) for out in output]
+
+
+def normalise_phrases(phrases):
+    return {phrase.strip().lower() for phrase in phrases if phrase and phrase.strip()}
+
+
+class PhraseCounts:
+    """
+    Use phrases per medicine, to turn a new catalogue version into the
+    phrases that appeared and disappeared. A phrase shared by several
+    medicines goes only when the last of them drops it.
+    """
+
+    def __init__(self):
+        # key -> (raw uses as given, their normalised phrase set)
+        self.by_medicine = {}
+        self.counts = Counter()
+
+    def diff(self, uses_by_medicine):
+        """``(added, removed)`` phrase sets, relative to the last call.
+
+        ``uses_by_medicine`` maps a medicine key to a tuple of its raw use
+        strings; only medicines whose tuple changed are normalised.
+        """
+        added, removed = set(), set()
+        previous = self.by_medicine
+        current = {}
+        empty = ((), frozenset())
+        for key, uses in uses_by_medicine.items():
+            entry = previous.get(key, empty)
+            if entry[0] != uses:
+                new = frozenset(normalise_phrases(uses))
+                self._move(entry[1], new, added, removed)
+                entry = (uses, new)
+            current[key] = entry
+        for key in previous.keys() - uses_by_medicine.keys():
+            self._move(previous[key][1], frozenset(), added, removed)
+        self.by_medicine = current
+        # Moved from one medicine to another within the same version
+        both = added & removed
+        return added - both, removed - both
+
+    def _move(self, old, new, added, removed):
+        for phrase in old - new:
+            self.counts[phrase] -= 1
+            if not self.counts[phrase]:
+                del self.counts[phrase]
+                removed.add(phrase)
+        for phrase in new - old:
+            self.counts[phrase] += 1
+            if self.counts[phrase] == 1:
+                added.add(phrase)
+
+    def __len__(self):
+        return len(self.counts)
+
+
+class KeywordAutomaton:
+    """
+    ``keywords`` maps a group name to substrings that flag it anywhere in
+    the text, like ``keyword in text``. Phrases (maintained with every
+    catalogue version) only match on word boundaries, the way the
+    PhraseMatcher matched whole tokens.
+    """
+
+    def __init__(self, keywords, phrases=(), max_delta=500):
+        self.keywords = keywords
+        self.max_delta = max_delta
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.updates = 0
+        self.build_seconds = 0.0
+        self.last_change = None
+        self.build(phrases)
+
+    def __len__(self):
+        return self._state[4]
+
+    @property
+    def version(self):
+        return self._state[3]
+
+    def build(self, phrases, version=None):
+        """Compile the keywords and ``phrases`` from scratch."""
+        started = time.perf_counter()
+        phrases = normalise_phrases(phrases)
+        with self._lock:
+            self._build(phrases, version)
+            self._changed("build", started, len(phrases), 0)
+
+    def _build(self, phrases, version):
+        # Each pattern is (length, group or None for a phrase)
+        patterns = [(keyword, (len(keyword), group))
+                    for group, keywords in self.keywords.items() for keyword in keywords]
+        patterns += [(phrase, (len(phrase), None)) for phrase in sorted(phrases)]
+        self._base_phrases = phrases
+        self._delta_phrases = set()
+        self._hidden = set()
+        # (base tables, delta tables or None, hidden phrases, version, phrase count)
+        self._state = (compile_patterns(patterns), None, frozenset(), version, len(phrases))
+
+    def update(self, added, removed, version=None):
+        """Add and remove use phrases, without recompiling the rest."""
+        started = time.perf_counter()
+        added, removed = normalise_phrases(added), normalise_phrases(removed)
+        with self._lock:
+            delta, hidden = set(self._delta_phrases), set(self._hidden)
+            for phrase in removed - added:
+                if phrase in delta:
+                    delta.discard(phrase)
+                elif phrase in self._base_phrases:
+                    hidden.add(phrase)
+            for phrase in added - removed:
+                if phrase in hidden:
+                    hidden.discard(phrase)
+                elif phrase not in self._base_phrases:
+                    delta.add(phrase)
+
+            phrases = (self._base_phrases - hidden) | delta
+            if len(delta) + len(hidden) > self.max_delta:
+                self._build(phrases, version)
+                self._changed("build", started, len(added), len(removed))
+                return
+
+            self._delta_phrases, self._hidden = delta, hidden
+            tables = compile_patterns([(p, (len(p), None)) for p in sorted(delta)]) if delta else None
+            self._state = (self._state[0], tables, frozenset(hidden), version, len(phrases))
+            self._changed("update", started, len(added), len(removed))
+
+    def _changed(self, kind, started, added, removed):
+        seconds = time.perf_counter() - started
+        if kind == "build":
+            self.builds += 1
+        else:
+            self.updates += 1
+        self.build_seconds += seconds
+        self.last_change = {
+            "kind": kind,
+            "seconds": round(seconds, 6),
+            "added": added,
+            "removed": removed,
+            "version": self._state[3],
+        }
+
+    def search(self, text):
+        """Every keyword group and whole-word phrase in ``text`` (already lower-cased)."""
+        base, delta, hidden = self._state[:3]
+        matches = KeywordMatches()
+        found = self._scan(base, text, matches.groups, hidden)
+        if delta is not None:
+            found += self._scan(delta, text, matches.groups, hidden)
+            # The order one automaton over all the phrases would give
+            found.sort()
+        matches.phrases = [text[end - length + 1:end + 1] for end, _, length in found]
+        return matches
+
+    @staticmethod
+    def _scan(tables, text, groups, hidden):
+        """``(end, -length, length)`` of each phrase found; groups go into ``groups``."""
+        goto, fail, output = tables
+        found = []
+        state = 0
+        last = len(text) - 1
+        for end, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, group in output[state]:
+                if group is not None:
+                    groups.add(group)
+                    continue
+                start = end - length + 1
+                if start > 0 and text[start - 1].isalnum() and text[start].isalnum():
+                    continue
+                if end < last and text[end + 1].isalnum() and ch.isalnum():
+                    continue
+                if hidden and text[start:end + 1] in hidden:
+                    continue
+                found.append((end, -length, length))
+        return found
+
+    def stats(self):
+        base, delta, hidden, version, phrases = self._state
+        return {
+            "version": version,
+            "phrases": phrases,
+            "delta_phrases": len(self._delta_phrases),
+            "hidden_phrases": len(hidden),
+            "states": len(base[0]) + (len(delta[0]) if delta else 0),
+            "builds": self.builds,
+            "updates": self.updates,
+            "build_seconds": round(self.build_seconds, 6),
+            "last_change": dict(self.last_change) if self.last_change else None,
+        }
@@ -0,0 +1,373 @@
+"""
+Shared, versioned in-memory snapshot of the medicines catalogue.
+
+Refreshed in the background from a MongoDB change stream or by polling
+with a checksum, so the chat pipeline reads medicines without a query.
+Medicines are kept as compact ``MedicineRecord`` objects holding only the
+projected fields; ``DetailsCache`` serves the rest.
+"""
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure, PyMongoError
+
+from background import OncePerProcess
+from symptom_index import USE_FIELDS
+
+# Only what the chat pipeline needs; descriptions etc. stay in Mongo
+PROJECTION = {
+    "name": 1,
+    "use0": 1, "use1": 1, "use2": 1, "use3": 1, "use4": 1,
+    "price": 1,
+    "priceNumeric": 1,
+    "in_stock": 1,
+    "dosage": 1,
+    "delivery_time": 1,
+    "category": 1,
+    "manufacturer": 1,
+}
+# Everything else: description, side effects, precautions...
+DETAILS_PROJECTION = {field: 0 for field in PROJECTION}
+# Projected fields kept in a slot of their own (the uses share one tuple)
+RECORD_FIELDS = ("_id", "name", "price", "priceNumeric", "in_stock", "dosage",
+                 "delivery_time", "category", "manufacturer")
+# Values repeated across the catalogue, kept once per process
+INTERNED_FIELDS = {"price", "dosage", "delivery_time", "category", "manufacturer"}
+
+_MISSING = object()
+
+
+class MedicineRecord:
+    """
+    One medicine, read like the document it was loaded from
+    (``med["name"]``, ``med.get("use0")``). The projected fields live in
+    slots, shared strings (uses, dosages, prices, categories,
+    manufacturers) are interned, and a field left out of the projection
+    (description, side effects, ...) is read through
+    ``details_loader(_id, field)`` (see ``DetailsCache``).
+    """
+
+    __slots__ = RECORD_FIELDS + ("_uses", "_details_loader")
+
+    def __init__(self, doc, details_loader=None):
+        for field in RECORD_FIELDS:
+            value = doc.get(field, _MISSING)
+            if value is _MISSING:
+                continue
+            if field in INTERNED_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, field, value)
+        uses = [doc.get(field, _MISSING) for field in USE_FIELDS]
+        while uses and uses[-1] is _MISSING:
+            uses.pop()
+        self._uses = tuple(sys.intern(use) if isinstance(use, str) else use for use in uses)
+        self._details_loader = details_loader
+
+    def _lookup(self, key):
+        if key in _SLOTTED:
+            return getattr(self, key, _MISSING)
+        index = _USE_INDEX.get(key)
+        if index is not None:
+            return self._uses[index] if index < len(self._uses) else _MISSING
+        if self._details_loader is None or not hasattr(self, "_id"):
+            return _MISSING
+        return self._details_loader(self._id, key)
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self._lookup(key) is not _MISSING
+
+    def __repr__(self):
+        return f"MedicineRecord({getattr(self, 'name', None)!r})"
+
+
+_SLOTTED = set(RECORD_FIELDS)
+_USE_INDEX = {field: i for i, field in enumerate(USE_FIELDS)}
+
+
+class DetailsCache:
+    """
+    ``details_loader`` for the fields the projection leaves out. The first
+    read of a medicine fetches all of them from ``collection()`` in one
+    query; they are kept for the ``max_size`` most recently read medicines
+    until ``clear()``, which the catalogue calls on every refresh.
+    """
+
+    def __init__(self, collection, max_size=256):
+        self.collection = collection
+        self.max_size = max_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __call__(self, _id, field):
+        with self._lock:
+            details = self._cache.get(_id)
+            if details is not None:
+                self._cache.move_to_end(_id)
+                self.hits += 1
+        if details is None:
+            self.misses += 1
+            details = self.collection().find_one({"_id": _id}, DETAILS_PROJECTION) or {}
+            self._put(_id, details)
+        return details.get(field, _MISSING)
+
+    def _put(self, _id, details):
+        if not self.max_size:
+            return
+        with self._lock:
+            self._cache[_id] = details
+            self._cache.move_to_end(_id)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "cached": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+        }
+
+
+class CatalogueSnapshot:
+    def __init__(self, medicines, version, checksum, details_loader=None):
+        self.medicines = [MedicineRecord(m, details_loader) for m in medicines]
+        self.version = version
+        self.checksum = checksum
+        self.names = [m["name"] for m in self.medicines if m.get("name")]
+        self.by_id = {str(m["_id"]): m for m in self.medicines if "_id" in m}
+        # First medicine per name key, as find_one({"name_key": ...}) returns it
+        self.by_name_key = {}
+        for med in self.medicines:
+            self.by_name_key.setdefault(name_key(med.get("name")), med)
+        self.loaded_at = time.time()
+
+
+def checksum_of(medicines):
+    digest = hashlib.sha1()
+    for med in medicines:
+        digest.update(json.dumps(med, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def name_key(name):
+    """Normalised medicine name for exact, indexed lookups.
+
+    Lower-cased, with runs of whitespace and punctuation folded to one
+    space. Keep in step with ``nameKey`` in backend/models/MedicineDetails.js.
+    """
+    return re.sub(r"[\W_]+", " ", str(name or "").lower()).strip()
+
+
+def backfill_name_keys(collection, batch_size=500):
+    """Set ``name_key`` on medicines stored without one (or with a stale one).
+
+    Returns the number of documents updated.
+    """
+    ops = []
+    updated = 0
+    for med in collection.find({}, {"name": 1, "name_key": 1}):
+        key = name_key(med.get("name"))
+        if med.get("name_key") != key:
+            ops.append(UpdateOne({"_id": med["_id"]}, {"$set": {"name_key": key}}))
+        if len(ops) >= batch_size:
+            collection.bulk_write(ops, ordered=False)
+            updated += len(ops)
+            ops = []
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+        updated += len(ops)
+    return updated
+
+
+class CatalogueCache:
+    """
+    ``loader()`` returns the projected medicine documents; ``watcher()``
+    opens a change stream; ``details_loader(_id, field)`` reads a field
+    the projection leaves out (see ``MedicineRecord``), and its ``clear()``,
+    if it has one, is called on every refresh. ``mode`` is ``"change_stream"``, ``"poll"`` or
+    ``"off"``; change streams fall back to polling when the deployment
+    does not support them (e.g. a standalone mongod).
+    """
+
+    def __init__(self, loader, watcher=None, mode="poll", poll_interval=60, details_loader=None,
+                 coalesce_seconds=1.0):
+        self.loader = loader
+        self.watcher = watcher
+        self.details_loader = details_loader
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.coalesce_seconds = coalesce_seconds
+        self._snapshot = None
+        self._published = None
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._started = OncePerProcess()
+        # Only a polling refresher promises a sync every poll_interval
+        self._polling = False
+        self.synced_at = None
+        self.hits = 0
+        self.misses = 0
+        self.stale_reads = 0
+        self.refreshes = 0
+        self.unchanged_polls = 0
+        self.coalesced_events = 0
+        self.last_error = None
+
+    def subscribe(self, listener):
+        """Call ``listener(snapshot)`` whenever a new version is published."""
+        with self._publish_lock:
+            self._listeners.append(listener)
+            if self._published is not None:
+                listener(self._published)
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.misses += 1
+            snapshot = self.refresh()
+        else:
+            self.hits += 1
+            if self._polling and self.staleness() > 2 * self.poll_interval:
+                self.stale_reads += 1
+        self.start()
+        return snapshot
+
+    def staleness(self):
+        """Seconds since the snapshot was last confirmed against Mongo."""
+        return time.time() - self.synced_at if self.synced_at else None
+
+    def refresh(self):
+        """Reload from Mongo and publish a new version if anything changed."""
+        with self._lock:
+            medicines = list(self.loader())
+            checksum = checksum_of(medicines)
+            self.synced_at = time.time()
+            # Edits to the other fields leave the checksum as it was
+            clear = getattr(self.details_loader, "clear", None)
+            if clear is not None:
+                clear()
+
+            current = self._snapshot
+            if current is not None and current.checksum == checksum:
+                self.unchanged_polls += 1
+                return current
+
+            version = current.version + 1 if current else 1
+            snapshot = CatalogueSnapshot(medicines, version, checksum, self.details_loader)
+            self._snapshot = snapshot
+            self.refreshes += 1
+
+        self._publish(snapshot)
+        return snapshot
+
+    def _publish(self, snapshot):
+        """Hand ``snapshot`` to the listeners, unless a newer one got there first."""
+        with self._publish_lock:
+            # Two refreshes (an admin reload racing the watcher) can finish
+            # out of order; listeners must never go back a version
+            if self._published is not None and self._published.version >= snapshot.version:
+                return
+            self._published = snapshot
+            for listener in self._listeners:
+                try:
+                    listener(snapshot)
+                except Exception as e:
+                    print(f"Catalogue listener error: {e}")
+
+    def start(self):
+        """Start the background refresher once per process (fork safe)."""
+        if self.mode == "off" or not self._started.claim():
+            return
+        target = self._watch if self.mode == "change_stream" and self.watcher else self._poll
+        threading.Thread(target=target, name="catalogue-refresh", daemon=True).start()
+
+    def _safe_refresh(self):
+        try:
+            self.refresh()
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Catalogue refresh failed: {e}")
+
+    def _poll(self):
+        self._polling = True
+        while True:
+            time.sleep(self.poll_interval)
+            self._safe_refresh()
+
+    def _drain(self, stream):
+        """Skip the events already waiting behind the one just received.
+
+        A bulk write (the name key backfill, an import) is one event per
+        document; one reload after the burst covers all of them.
+        """
+        deadline = time.monotonic() + self.coalesce_seconds
+        while time.monotonic() < deadline and stream.try_next() is not None:
+            self.coalesced_events += 1
+
+    def _watch(self):
+        while True:
+            try:
+                with self.watcher() as stream:
+                    # Anything written while the stream was down
+                    self._safe_refresh()
+                    for _change in stream:
+                        self._drain(stream)
+                        self._safe_refresh()
+            except OperationFailure as e:
+                # Standalone servers have no oplog to stream from
+                self.last_error = str(e)
+                print(f"Catalogue change stream unavailable ({e}); polling instead.")
+                self._poll()
+            except PyMongoError as e:
+                # Transient (network, failover): reopen the stream
+                self.last_error = str(e)
+                time.sleep(min(self.poll_interval, 5))
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Catalogue change stream failed ({e}); polling instead.")
+                self._poll()
+
+    def stats(self):
+        snapshot = self._snapshot
+        staleness = self.staleness()
+        return {
+            "version": snapshot.version if snapshot else 0,
+            "medicines": len(snapshot.medicines) if snapshot else 0,
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_reads": self.stale_reads,
+            "refreshes": self.refreshes,
+            "unchanged_polls": self.unchanged_polls,
+            "coalesced_events": self.coalesced_events,
+            "staleness_seconds": round(staleness, 3) if staleness is not None else None,
+            "last_error": self.last_error,
+        }
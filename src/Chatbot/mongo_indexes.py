@@ -0,0 +1,77 @@
+"""
+Idempotent index bootstrap for the collections the chatbot queries.
+
+``create_index`` is a no-op for an index that already exists with the same
+keys and options, so this runs on every startup (as a warm-up step, so a
+long build on a big collection doesn't hold up the worker) and from the
+``flask --app app ensure-indexes`` command. Build status per index is kept
+for the health route.
+"""
+import threading
+import time
+
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+
+# (collection, keys, create_index options); default index names are used so
+# indexes created by hand or by the Node models are recognised
+INDEXES = [
+    ("sessions", [("session_id", ASCENDING)], {"unique": True}),
+    # _id breaks timestamp ties for /chat_history cursors
+    ("chats", [("session_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)], {}),
+    ("medicines", [("in_stock", ASCENDING)], {}),
+    ("medicines", [("name_key", ASCENDING)], {}),
+]
+
+
+def index_name(keys):
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+class IndexBootstrap:
+    def __init__(self, db, indexes=INDEXES):
+        self.db = db
+        self.indexes = indexes
+        self._lock = threading.Lock()
+        self.status = {
+            f"{collection}.{index_name(keys)}": {"state": "pending"}
+            for collection, keys, _ in indexes
+        }
+
+    def run(self):
+        """Create every index; returns True if all of them are in place.
+
+        An index the server refused (``OperationFailure``, e.g. duplicate
+        session_ids blocking the unique index) is marked ``final``: building
+        it again fails the same way until someone fixes the data.
+        """
+        with self._lock:
+            ok = True
+            for collection, keys, options in self.indexes:
+                entry = self.status[f"{collection}.{index_name(keys)}"]
+                entry.clear()
+                entry.update(state="building", started_at=time.time())
+                try:
+                    self.db()[collection].create_index(keys, **options)
+                    entry.update(state="ready", finished_at=time.time())
+                except PyMongoError as e:
+                    ok = False
+                    entry.update(state="failed", finished_at=time.time(), error=str(e),
+                                 final=isinstance(e, OperationFailure))
+                    print(f"Index {collection}.{index_name(keys)} failed: {e}")
+            return ok
+
+    def retryable(self):
+        """True if an index failed for a reason that may go away (network, failover)."""
+        return any(entry["state"] == "failed" and not entry.get("final")
+                   for entry in self.status.values())
+
+    def stats(self):
+        states = {entry["state"] for entry in self.status.values()}
+        for state in ("failed", "building", "pending"):
+            if state in states:
+                overall = state
+                break
+        else:
+            overall = "ready"
+        return {"state": overall, "indexes": {name: dict(entry) for name, entry in self.status.items()}}
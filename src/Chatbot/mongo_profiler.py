@@ -0,0 +1,262 @@
+"""
+Per-request Mongo command profiler and N+1 detector (debug mode).
+
+A pymongo command listener records the commands sent while a request is
+served. Commands sent ``repeat`` times or more, identical or with the
+same shape and different values (an N+1 loop), are flagged and printed,
+and the latest profiles are kept for /admin/mongo-profile.
+``timing_header`` turns a profile into a ``Server-Timing`` header.
+
+Queries are only shown as shapes (values replaced by "?") plus a digest
+telling identical ones apart, since session ids are auth tokens. Off by
+default; commands from background threads are never recorded.
+"""
+import contextvars
+import hashlib
+import json
+import time
+from collections import Counter, deque
+
+from bson import json_util
+from pymongo import monitoring
+
+# Driver bookkeeping, not part of what a command asks for
+IGNORED_FIELDS = {
+    "lsid", "$clusterTime", "$db", "txnNumber", "autocommit", "startTransaction",
+    "$readPreference", "readConcern", "writeConcern", "apiVersion", "apiStrict",
+    "apiDeprecationErrors", "comment", "maxTimeMS",
+}
+# Commands that are repeated by design
+UNFLAGGED = {"getMore", "killCursors", "endSessions", "ping", "hello", "isMaster", "ismaster"}
+
+_current = contextvars.ContextVar("mongo_profile", default=None)
+
+
+def _body(command):
+    return {k: v for k, v in command.items() if k not in IGNORED_FIELDS}
+
+
+def _shape(value):
+    """``value`` with every scalar replaced by "?", lists collapsed to one item."""
+    if isinstance(value, dict):
+        return {k: _shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in map(_shape, value):
+            if item not in shapes:
+                shapes.append(item)
+        return shapes
+    return "?"
+
+
+def _text(value):
+    return json_util.dumps(value, sort_keys=True)
+
+
+def _digest(value):
+    return hashlib.sha1(_text(value).encode("utf-8")).hexdigest()[:12]
+
+
+def _returned(name, reply):
+    """Documents a command returned, or changed for a write."""
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    if name == "findAndModify":
+        return 1 if reply.get("value") else 0
+    if isinstance(reply.get("n"), int):
+        return reply["n"]
+    return 0
+
+
+class RequestProfile:
+    """Commands one request has sent so far."""
+
+    def __init__(self, endpoint, method=None, path=None):
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.seconds = None
+        # Dicts in the order the commands were sent
+        self.commands = []
+        # (connection, request id) -> command waiting for its reply
+        self._pending = {}
+        self.repeated = []
+        self.n_plus_one = []
+
+    @property
+    def mongo_seconds(self):
+        return sum(c["ms"] for c in self.commands if c["ms"] is not None) / 1e3
+
+    def flagged(self):
+        return bool(self.repeated or self.n_plus_one)
+
+    def analyse(self, repeat):
+        queries = Counter()
+        shapes = {}
+        for command in self.commands:
+            if command["command"] in UNFLAGGED:
+                continue
+            key = (command["command"], command["collection"], command["query_id"], command["shape"])
+            queries[key] += 1
+            shapes.setdefault((command["command"], command["collection"], command["shape"]), set()).add(key)
+        self.repeated = [
+            {"command": name, "collection": collection, "count": count,
+             "query_id": query_id, "shape": shape}
+            for (name, collection, query_id, shape), count in queries.items() if count >= repeat
+        ]
+        self.n_plus_one = []
+        for (name, collection, shape), keys in shapes.items():
+            count = sum(queries[key] for key in keys)
+            if len(keys) > 1 and count >= repeat:
+                self.n_plus_one.append(
+                    {"command": name, "collection": collection, "count": count,
+                     "distinct": len(keys), "shape": shape})
+
+    def to_dict(self):
+        return {
+            "endpoint": self.endpoint,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "ms": round(self.seconds * 1e3, 3) if self.seconds is not None else None,
+            "mongo_ms": round(self.mongo_seconds * 1e3, 3),
+            "commands": self.commands,
+            "repeated": self.repeated,
+            "n_plus_one": self.n_plus_one,
+        }
+
+
+class CommandProfiler(monitoring.CommandListener):
+    """Records commands into the profile of the request that sent them."""
+
+    def started(self, event):
+        profile = _current.get()
+        if profile is None:
+            return
+        body = _body(event.command)
+        target = body.pop(event.command_name, None)
+        command = {
+            "command": event.command_name,
+            "collection": target if isinstance(target, str) else None,
+            "query_id": _digest(body),
+            "shape": _text(_shape(body)),
+            "ms": None,
+            "docs": None,
+            "ok": None,
+        }
+        profile.commands.append(command)
+        profile._pending[(event.connection_id, event.request_id)] = command
+
+    def succeeded(self, event):
+        command = self._finish(event, True)
+        if command is not None:
+            command["docs"] = _returned(event.command_name, event.reply)
+
+    def failed(self, event):
+        command = self._finish(event, False)
+        if command is not None:
+            # errmsg can quote the values (a duplicate key error names the key)
+            command["error"] = event.failure.get("codeName") or f"code {event.failure.get('code')}"
+
+    @staticmethod
+    def _finish(event, ok):
+        profile = _current.get()
+        if profile is None:
+            return None
+        command = profile._pending.pop((event.connection_id, event.request_id), None)
+        if command is not None:
+            command["ms"] = round(event.duration_micros / 1e3, 3)
+            command["ok"] = ok
+        return command
+
+
+class MongoProfiler:
+    def __init__(self, enabled=False, repeat=2, keep=100, server_timing=False):
+        self.enabled = enabled
+        self.repeat = repeat
+        self.server_timing = enabled and server_timing
+        self.listener = CommandProfiler()
+        self.recent = deque(maxlen=keep)
+        self.requests = 0
+        self.flagged = 0
+
+    def event_listeners(self):
+        """For ``MongoClient(event_listeners=...)``; none while disabled."""
+        return [self.listener] if self.enabled else []
+
+    def begin(self, endpoint, method=None, path=None):
+        """Start profiling a request; returns a token for ``end``."""
+        if not self.enabled:
+            return None
+        return _current.set(RequestProfile(endpoint, method, path))
+
+    def current(self):
+        return _current.get()
+
+    def end(self, token):
+        """Finish the request started with ``begin``; prints it if flagged."""
+        if token is None:
+            return None
+        profile = _current.get()
+        _current.reset(token)
+        if profile is None:
+            return None
+        profile.seconds = time.perf_counter() - profile.started
+        profile.analyse(self.repeat)
+        self.requests += 1
+        if profile.flagged():
+            self.flagged += 1
+            self.log(profile)
+        self.recent.append(profile)
+        return profile
+
+    def log(self, profile):
+        for entry in profile.repeated:
+            print(f"Mongo profile {profile.endpoint}: {entry['command']} {entry['collection']} "
+                  f"sent {entry['count']}x with the same query ({entry['query_id']}) shaped {entry['shape']}")
+        for entry in profile.n_plus_one:
+            print(f"Mongo profile {profile.endpoint}: possible N+1, {entry['command']} {entry['collection']} "
+                  f"sent {entry['count']}x ({entry['distinct']} distinct) shaped {entry['shape']}")
+
+    def report(self, flagged_only=False, limit=None):
+        """Newest first, for /admin/mongo-profile."""
+        profiles = [p for p in reversed(self.recent) if p.flagged() or not flagged_only]
+        return {
+            "stats": self.stats(),
+            "profiles": [p.to_dict() for p in profiles[:limit]],
+        }
+
+    def timing_header(self, profile, spans=()):
+        """``Server-Timing`` value: Mongo total, per command name and ``spans``.
+
+        ``spans`` are ``(stage, seconds)``, e.g. the chat metrics stage spans.
+        Sent before ``end``, so the profile is analysed here for the
+        flagged count.
+        """
+        profile.analyse(self.repeat)
+        totals = {}
+        for command in profile.commands:
+            count, ms = totals.get(command["command"], (0, 0.0))
+            totals[command["command"]] = (count + 1, ms + (command["ms"] or 0.0))
+        flagged = len(profile.repeated) + len(profile.n_plus_one)
+        count = len(profile.commands)
+        desc = f"{count} command{'' if count == 1 else 's'}" + (f", {flagged} flagged" if flagged else "")
+        entries = [f"mongo;dur={profile.mongo_seconds * 1e3:.3f};desc={json.dumps(desc)}"]
+        for name, (count, ms) in totals.items():
+            entries.append(f"mongo-{name};dur={ms:.3f};desc=\"{count}x\"")
+        for stage, seconds in spans:
+            entries.append(f"{stage};dur={seconds * 1e3:.3f}")
+        return ", ".join(entries)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "requests": self.requests,
+            "flagged": self.flagged,
+            "repeat_threshold": self.repeat,
+            "kept": len(self.recent),
+        }
+
@@ -0,0 +1,137 @@
+"""
+Precompiled fuzzy matcher for medicine names mentioned in chat messages.
+
+Gives the same matches as ``process.extract(message, names, limit=n)``
+filtered to WRatio scores above 80, but names are normalised once up front
+and only names that pass a length filter and share enough token trigrams
+with the message are scored.
+"""
+import heapq
+import threading
+from collections import Counter
+
+from fuzzywuzzy import fuzz, utils
+
+MATCH_THRESHOLD = 80
+# Past this length ratio WRatio scales partial matches by 0.6, and the
+# plain ratio cannot exceed 2/9, so nothing can clear the threshold
+MAX_LENGTH_RATIO = 8
+# Below this ratio WRatio compares whole strings and can accept looser
+# matches, so a single shared gram is all we can require
+PARTIAL_LENGTH_RATIO = 1.5
+# A partial score > 80 needs a 90+ partial ratio (after the 0.9 scale), so at
+# most 0.21 x len(shorter) characters of the aligned window are unmatched
+MAX_UNMATCHED_FRACTION = 0.21
+
+
+def normalise(text):
+    """Same preprocessing process.extract applies before WRatio."""
+    return utils.full_process(utils.full_process(text), force_ascii=True)
+
+
+def token_grams(text):
+    """Trigrams of each token padded with ``^``/``$``.
+
+    Grams are per token so token-sorted comparisons inside WRatio still
+    share them; single-letter tokens yield one ``^x$`` gram.
+    """
+    grams = set()
+    for token in text.split():
+        padded = f"^{token}$"
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def required_shared_grams(short_len, short_grams):
+    """Grams the shorter string must share for a partial match to clear 80.
+
+    Every unmatched character destroys at most three trigrams, and the
+    window edges can cut two more token-start/end grams. Zero or less means
+    a string this short can match without sharing any gram.
+    """
+    unmatched = int(MAX_UNMATCHED_FRACTION * short_len)
+    return short_grams - 3 * unmatched - 2
+
+
+class NameMatcher:
+    def __init__(self, names=()):
+        self._lock = threading.Lock()
+        self.build(names)
+
+    def __len__(self):
+        return len(self._state[0])
+
+    def build(self, names):
+        names = list(names)
+        processed = [utils.full_process(name, force_ascii=True) for name in names]
+        gram_counts = []
+        grams = {}
+        tokens = {}
+        # Names short enough to match as a partial without sharing a gram
+        unblockable = []
+        for pos, name in enumerate(processed):
+            name_grams = token_grams(name)
+            gram_counts.append(len(name_grams))
+            if name and required_shared_grams(len(name), len(name_grams)) <= 0:
+                unblockable.append(pos)
+            for gram in name_grams:
+                grams.setdefault(gram, []).append(pos)
+            for token in set(name.split()):
+                tokens.setdefault(token, []).append(pos)
+
+        with self._lock:
+            self._state = (names, processed, gram_counts, grams, tokens, unblockable)
+
+    def candidates(self, processed_query):
+        """Positions worth scoring, in catalogue order."""
+        _, processed, gram_counts, grams, tokens, unblockable = self._state
+        query_len = len(processed_query)
+        query_grams = token_grams(processed_query)
+
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(grams.get(gram, ()))
+
+        if required_shared_grams(query_len, len(query_grams)) <= 0:
+            # A very short message can sit inside any longer name
+            pool = range(len(processed))
+        else:
+            pool = sorted(set(shared).union(unblockable))
+
+        # partial_token_set_ratio is 100 as soon as one whole token is shared
+        shared_token = set()
+        for token in set(processed_query.split()):
+            shared_token.update(tokens.get(token, ()))
+
+        shortlist = []
+        for pos in pool:
+            name_len = len(processed[pos])
+            longer, shorter = max(name_len, query_len), min(name_len, query_len)
+            if not shorter or longer > MAX_LENGTH_RATIO * shorter:
+                continue
+            if longer < PARTIAL_LENGTH_RATIO * shorter:
+                if not shared[pos]:
+                    continue
+            elif pos not in shared_token:
+                short_grams = gram_counts[pos] if name_len <= query_len else len(query_grams)
+                if shared[pos] < required_shared_grams(shorter, short_grams):
+                    continue
+            shortlist.append(pos)
+        return shortlist
+
+    def extract(self, query, limit=5, threshold=MATCH_THRESHOLD):
+        """Return up to ``limit`` ``(name, score)`` pairs scoring above ``threshold``.
+
+        Ties keep catalogue order, like ``process.extract``.
+        """
+        names, processed = self._state[:2]
+        processed_query = normalise(query)
+        if not processed_query:
+            return []
+
+        scored = []
+        for pos in self.candidates(processed_query):
+            score = fuzz.WRatio(processed_query, processed[pos], full_process=False)
+            if score > threshold:
+                scored.append((names[pos], score))
+        return heapq.nlargest(limit, scored, key=lambda match: match[1])
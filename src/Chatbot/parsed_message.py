@@ -0,0 +1,159 @@
+"""
+One chat message, normalised and tokenised once for the whole /chat pipeline.
+
+Keyword matches, tokens and quantity are computed on first use, so a
+message answered by the cart stage never pays for symptom tokenising.
+"""
+import re
+
+# Split off as separate tokens wherever they occur (NLTK's Treebank rules);
+# "-", "/", "'" and single periods inside a word are kept
+SPLIT_PUNCT = re.compile(r"""\s+|(\.{2,}|--|''|[;@#$%&?!*()\[\]{}<>"`«»“”‘’„]|[:,](?!\d))""")
+# Clitics split off the end of a word: "patient's" -> "patient" + "'s", in
+# two passes like Treebank's, so "you've'" -> "you" + "'ve" + "'"
+CLITICS = [
+    re.compile(r"(?<=[^' ])('[sSmMdD]|')$"),
+    re.compile(r"(?<=[^' ])('ll|'LL|'re|'RE|'ve|'VE|n't|N'T)$"),
+]
+CONTRACTIONS = [
+    re.compile(pattern) for pattern in (
+        r"(?i)\b(can)(not)\b", r"(?i)\b(d)('ye)\b", r"(?i)\b(gim)(me)\b",
+        r"(?i)\b(gon)(na)\b", r"(?i)\b(got)(ta)\b", r"(?i)\b(lem)(me)\b",
+        r"(?i)\b(more)('n)\b", r"(?i)\b(wan)(na)$", r"(?i)^('t)(is)\b", r"(?i)^('t)(was)\b",
+    )
+]
+CONTRACTION_HINT = re.compile(r"(?i)cannot|d'ye|gimme|gonna|gotta|lemme|more'n|wanna|'tis|'twas")
+# Punkt's "after_tok": what may directly follow a sentence-ending . ? or !
+PUNKT_AFTER = set("?!)\";}]*:@'({[")
+NEXT_TOKEN = re.compile(r"\s+\S")
+
+NUMBER_WORDS = {
+    'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
+    'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10
+}
+SYMPTOM_WORD = re.compile(r'^[a-z]{3,15}$')
+
+
+def word_tokenize(text):
+    """Regex tokenizer standing in for ``nltk.word_tokenize``.
+
+    Follows the Punkt and Treebank rules NLTK applies (punctuation, clitics,
+    contractions, sentence-final periods), so alphabetic tokens come out the
+    same, without loading Punkt models. Punkt's trained abbreviation list
+    (``dr.``, ``etc.``) is not consulted, so those lose their period
+    mid-sentence too.
+    """
+    tokens = []
+    pos = 0
+    for match in SPLIT_PUNCT.finditer(text):
+        if match.start() > pos:
+            _split_word(text, pos, match.start(), tokens)
+        if match.group(1):
+            tokens.append(match.group(1))
+        pos = match.end()
+    if pos < len(text):
+        _split_word(text, pos, len(text), tokens)
+    return tokens
+
+
+def _split_word(text, start, end, tokens):
+    """Append ``text[start:end]`` (no whitespace or split punctuation) as tokens."""
+    word = text[start:end]
+    tail = []
+    # Sentence-final period, possibly followed by closing quotes: "fever.'"
+    core = word.rstrip("'")
+    if len(core) > 1 and core[-1] == "." and core[-2] != "." and _ends_sentence(text, start + len(core)):
+        tail.append(".")
+        if len(core) < len(word):
+            tail.append(word[len(core):])
+        word = core[:-1]
+
+    for pattern in CLITICS:
+        clitic = pattern.search(word)
+        if clitic:
+            tail.insert(0, clitic.group(1))
+            word = word[:clitic.start()]
+
+    if word and CONTRACTION_HINT.search(word):
+        for pattern in CONTRACTIONS:
+            word = pattern.sub(r" \1 \2 ", word)
+        tokens.extend(word.split())
+    elif word:
+        tokens.append(word)
+    tokens.extend(tail)
+
+
+def _ends_sentence(text, i):
+    """Would Punkt end a sentence at the period just before ``text[i]``?"""
+    if i >= len(text) or text[i].isspace():
+        return True
+    if text[i] not in PUNKT_AFTER:
+        return False
+    # Punkt matches greedily: a later . ? or ! in the same run that can end
+    # a sentence is taken instead
+    for j in range(i, len(text)):
+        if text[j].isspace():
+            break
+        if text[j] in ".?!" and (
+            (j + 1 < len(text) and text[j + 1] in PUNKT_AFTER) or NEXT_TOKEN.match(text, j + 1)
+        ):
+            return False
+    return True
+
+
+def text_to_int(text):
+    for t in text.lower().replace(',', ' ').split():
+        if t.isdigit():
+            return int(t)
+        if t in NUMBER_WORDS:
+            return NUMBER_WORDS[t]
+    return None
+
+
+class ParsedMessage:
+    def __init__(self, text, automaton):
+        self.text = text
+        self.lower = text.lower()
+        self._automaton = automaton
+        self._matches = None
+        self._tokens = None
+        self._words = None
+        self._number = False
+
+    @property
+    def matches(self):
+        """One automaton pass over the message, shared by every stage."""
+        if self._matches is None:
+            self._matches = self._automaton.search(self.lower)
+        return self._matches
+
+    @property
+    def keywords(self):
+        """Keyword groups (intents, ``ALLERGY``) present in the message."""
+        return self.matches.groups
+
+    @property
+    def phrases(self):
+        """Use phrases from the catalogue found in the message."""
+        return self.matches.phrases
+
+    @property
+    def tokens(self):
+        if self._tokens is None:
+            self._tokens = word_tokenize(self.lower)
+        return self._tokens
+
+    @property
+    def words(self):
+        """Alphabetic 3-15 letter tokens, the broad symptom candidates."""
+        if self._words is None:
+            match = SYMPTOM_WORD.match
+            self._words = [w for w in self.tokens if match(w)]
+        return self._words
+
+    @property
+    def number(self):
+        """First quantity in the message (digits or one..ten), or None."""
+        if self._number is False:
+            self._number = text_to_int(self.lower)
+        return self._number
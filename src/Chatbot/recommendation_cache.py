@@ -0,0 +1,77 @@
+"""
+LRU + TTL cache of ``find_medicines`` rankings.
+
+Keyed by the sorted symptom tuple for one symptom index version; a new
+version empties the cache. A top-k ranking also answers any smaller k.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class RecommendationCache:
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(symptoms):
+        # Symptoms arrive lower-cased and the ranking ignores their order;
+        # duplicates count twice in it, so they stay in the key
+        return tuple(sorted(symptoms))
+
+    def get(self, version, symptoms, limit):
+        """The best ``limit`` medicines, or None if not cached for that many."""
+        key = self.key(symptoms)
+        with self._lock:
+            if version != self._version:
+                self._invalidate(version)
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._cache[key]
+                entry = None
+            # A shorter ranking than asked for means there were no more matches
+            if entry is None or (entry[1] < limit and len(entry[2]) == entry[1]):
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return entry[2][:limit]
+
+    def put(self, version, symptoms, limit, ranking):
+        if not self.max_size:
+            return
+        key = self.key(symptoms)
+        with self._lock:
+            if version != self._version:
+                self._invalidate(version)
+            self._cache[key] = (time.monotonic() + self.ttl, limit, ranking)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+
+    def _invalidate(self, version):
+        if self._cache:
+            self.invalidations += 1
+        self._cache.clear()
+        self._version = version
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "cached": len(self._cache),
+            "version": self._version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,311 @@
+"""
+Session state cache in front of the ``sessions`` collection.
+
+The field updates of one request are coalesced into a single ``$set``
+(``$setOnInsert`` for new sessions), written when the request ends or
+handed to a background flusher in write-behind mode. An optional
+per-process LRU cache with a TTL serves sessions without a read; a copy
+can be up to ``ttl`` seconds old, so it is off by default (``max_size=0``)
+and only safe when every request for a session reaches the same worker.
+"""
+import atexit
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from pymongo import UpdateOne
+
+from background import OncePerProcess
+
+
+class SessionWrites:
+    """Session views and field updates collected during one request."""
+
+    def __init__(self):
+        self.sessions = {}
+        self.updates = {}
+        # session_id -> defaults to $setOnInsert for sessions not in Mongo yet
+        self.created = {}
+
+    def __bool__(self):
+        return bool(self.updates or self.created)
+
+    def add(self, session_id, updates):
+        # Later values win, same as applying the $sets one by one
+        self.updates.setdefault(session_id, {}).update(updates)
+
+    def reset(self):
+        """Forget the updates once they are written (or queued)."""
+        self.updates = {}
+        self.created = {}
+
+    def merge(self, other):
+        for session_id, defaults in other.created.items():
+            self.created.setdefault(session_id, defaults)
+        for session_id, updates in other.updates.items():
+            self.add(session_id, updates)
+
+    def operations(self):
+        """One ``(filter, update)`` pair per touched session."""
+        operations = []
+        for session_id in dict.fromkeys(list(self.created) + list(self.updates)):
+            updates = self.updates.get(session_id, {})
+            update = {}
+            if updates:
+                update["$set"] = updates
+            defaults = {
+                k: v for k, v in self.created.get(session_id, {}).items()
+                if k != "session_id" and k not in updates
+            }
+            if defaults:
+                update["$setOnInsert"] = defaults
+            if update:
+                operations.append(({"session_id": session_id}, update))
+        return operations
+
+
+class SessionStore:
+    def __init__(self, collection, factory, max_size=0, ttl=60,
+                 write_behind=False, flush_interval=0.5):
+        self.collection = collection
+        self.factory = factory
+        self.max_size = max_size
+        self.ttl = ttl
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = SessionWrites()
+        self._started = OncePerProcess()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+        self.failed_writes = 0
+
+    # ---------- CACHE ----------
+    def _cached(self, session_id):
+        entry = self._cache.get(session_id)
+        if entry is None:
+            return None
+        expires_at, session = entry
+        if expires_at < time.monotonic():
+            del self._cache[session_id]
+            return None
+        self._cache.move_to_end(session_id)
+        return session
+
+    def _store(self, session):
+        if not self.max_size:
+            return
+        self._cache[session["session_id"]] = (time.monotonic() + self.ttl, copy.deepcopy(session))
+        self._cache.move_to_end(session["session_id"])
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+            self.evictions += 1
+
+    def evict(self, session_ids):
+        with self._lock:
+            for session_id in session_ids:
+                self._cache.pop(session_id, None)
+
+    def _view(self, session, writes):
+        """Request-local copy with not-yet-written updates applied."""
+        session = copy.deepcopy(session)
+        with self._lock:
+            session.update(copy.deepcopy(self._dirty.updates.get(session["session_id"], {})))
+        session.update(writes.updates.get(session["session_id"], {}))
+        view = writes.sessions.get(session["session_id"])
+        if view is None:
+            writes.sessions[session["session_id"]] = session
+            return session
+        # Callers may hold the view already; update it in place
+        view.update(session)
+        return view
+
+    # ---------- READS ----------
+    def get(self, session_id, writes, fresh=False):
+        """The request's view of a session; ``fresh`` re-reads it from Mongo."""
+        session = self._lookup(session_id, writes, fresh)
+        if session is not None:
+            return session
+        return self._load(session_id, self.collection().find_one({"session_id": session_id}), writes)
+
+    async def get_async(self, session_id, writes, collection, fresh=False):
+        """``get`` through an async driver ``collection`` (the ASGI app)."""
+        session = self._lookup(session_id, writes, fresh)
+        if session is not None:
+            return session
+        return self._load(session_id, await collection.find_one({"session_id": session_id}), writes)
+
+    def _lookup(self, session_id, writes, fresh):
+        """The session from the request or the cache, or None to read Mongo."""
+        session = writes.sessions.get(session_id)
+        if session is not None and not fresh:
+            return session
+
+        if not fresh:
+            with self._lock:
+                cached = self._cached(session_id)
+            if cached is not None:
+                self.hits += 1
+                return self._view(cached, writes)
+
+        self.misses += 1
+        return None
+
+    def _load(self, session_id, session, writes):
+        if not session:
+            session = self._create(session_id, writes)
+        return self.refresh(session, writes)
+
+    def prefetch(self, session_ids, writes):
+        """Load many sessions with one ``$in`` query (for /chat/batch)."""
+        missing = []
+        for session_id in dict.fromkeys(session_ids):
+            if session_id in writes.sessions:
+                continue
+            with self._lock:
+                cached = self._cached(session_id)
+            if cached is not None:
+                self.hits += 1
+                self._view(cached, writes)
+            else:
+                missing.append(session_id)
+        if not missing:
+            return
+
+        self.misses += len(missing)
+        found = {}
+        for session in self.collection().find({"session_id": {"$in": missing}}):
+            found.setdefault(session["session_id"], session)
+        for session_id in missing:
+            self.refresh(found.get(session_id) or self._create(session_id, writes), writes)
+
+    def _create(self, session_id, writes):
+        session = self.factory(session_id)
+        writes.created[session_id] = copy.deepcopy(session)
+        return session
+
+    # ---------- WRITES ----------
+    def update(self, session_id, updates, writes):
+        writes.add(session_id, updates)
+        view = writes.sessions.get(session_id)
+        if view is not None:
+            view.update(updates)
+        with self._lock:
+            cached = self._cached(session_id)
+            if cached is not None:
+                cached.update(copy.deepcopy(updates))
+
+    def refresh(self, session, writes):
+        """Adopt a document just read from (or atomically updated in) Mongo."""
+        pending = writes.updates.get(session["session_id"], {})
+        with self._lock:
+            self._store(session)
+            cached = self._cached(session["session_id"])
+            if cached is not None:
+                cached.update(copy.deepcopy(pending))
+        return self._view(session, writes)
+
+    def commit(self, writes):
+        """Write the request's coalesced updates (or queue them).
+
+        A failed write raises, after evicting the sessions it touched: the
+        request must fail rather than report state Mongo never got.
+        """
+        if not writes or self._queue(writes):
+            return
+        try:
+            self._write(writes)
+        except Exception as e:
+            self._write_failed(writes, e)
+            raise
+        finally:
+            writes.reset()
+
+    async def commit_async(self, writes, collection):
+        """``commit`` through an async driver ``collection``."""
+        if not writes or self._queue(writes):
+            return
+        try:
+            operations = writes.operations()
+            if len(operations) == 1:
+                await collection.update_one(*operations[0], upsert=True)
+            elif operations:
+                await collection.bulk_write(
+                    [UpdateOne(f, u, upsert=True) for f, u in operations], ordered=False
+                )
+            self.writes += len(operations)
+        except Exception as e:
+            self._write_failed(writes, e)
+            raise
+        finally:
+            writes.reset()
+
+    def _queue(self, writes):
+        """Hand ``writes`` to the write-behind flusher, if it is on."""
+        if not self.write_behind:
+            return False
+        with self._lock:
+            self._dirty.merge(writes)
+        writes.reset()
+        self.start()
+        return True
+
+    def _write_failed(self, writes, error):
+        # Don't keep serving state Mongo never got
+        self.failed_writes += 1
+        self.evict(list(writes.sessions) + list(writes.updates))
+        print(f"Session write failed: {error}")
+
+    def _write(self, writes):
+        operations = writes.operations()
+        if len(operations) == 1:
+            self.collection().update_one(*operations[0], upsert=True)
+        elif operations:
+            self.collection().bulk_write(
+                [UpdateOne(f, u, upsert=True) for f, u in operations], ordered=False
+            )
+        self.writes += len(operations)
+
+    # ---------- WRITE-BEHIND ----------
+    def start(self):
+        """Start the write-behind flusher once per process (fork safe)."""
+        if not self._started.claim():
+            return
+        threading.Thread(target=self._run, name="session-flush", daemon=True).start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._dirty = self._dirty, SessionWrites()
+        if not pending:
+            return
+        try:
+            self._write(pending)
+        except Exception as e:
+            self.failed_writes += 1
+            print(f"Session write-behind failed, will retry: {e}")
+            with self._lock:
+                # Newer updates stay on top of the ones that failed
+                pending.merge(self._dirty)
+                self._dirty = pending
+
+    def stats(self):
+        return {
+            "cached": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "writes": self.writes,
+            "pending": len(self._dirty.updates) + len(self._dirty.created),
+            "failed_writes": self.failed_writes,
+            "write_behind": self.write_behind,
+        }
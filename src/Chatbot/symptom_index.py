@@ -0,0 +1,213 @@
+"""
+Process-local inverted index over the medicine ``use0``..``use4`` fields.
+
+Maps exact use phrases, tokens, stems and character pairs to in-stock
+medicines, so only a shortlist is scored with ``calculate_relevance``.
+Scored postings are kept per symptom until the next rebuild, as NumPy rows
+of a sparse symptom x medicine matrix, so ranking a message is a handful
+of array operations.
+"""
+import threading
+
+import numpy as np
+from rapidfuzz.distance import Indel, Levenshtein
+from rapidfuzz.process import cpdist
+
+USE_FIELDS = [f"use{i}" for i in range(5)]
+MAX_CACHED_TERMS = 4096
+# rank() sorts this many of the best medicines per result it returns
+HEAD_PER_RESULT = 8
+
+
+def char_pairs(text):
+    """Adjacent and one-apart character pairs of ``text``.
+
+    A fuzzy partial ratio of 70+ between strings of 3+ characters always
+    leaves at least one such pair in common, so blocking on them never
+    drops a medicine that would have scored.
+    """
+    pairs = {text[i:i + 2] for i in range(len(text) - 1)}
+    pairs.update(text[i] + text[i + 2] for i in range(len(text) - 2))
+    return pairs
+
+
+def partial_ratios(query, choices):
+    """``fuzz.partial_ratio(query, choice)`` for every choice, same scores.
+
+    fuzzywuzzy (on python-Levenshtein, itself built on rapidfuzz) aligns the
+    shorter string with a window of the longer one at each matching block
+    and keeps the best Indel ratio. The blocks are found the same way here,
+    but the windows of all choices are scored in one ``cpdist`` call.
+    """
+    scores = [0] * len(choices)
+    shorts, windows, owners = [], [], []
+    for i, choice in enumerate(choices):
+        if query == choice:
+            scores[i] = 100
+            continue
+        if not query or not choice:
+            continue
+        shorter, longer = (query, choice) if len(query) <= len(choice) else (choice, query)
+        for a, b, _ in Levenshtein.opcodes(shorter, longer).as_matching_blocks():
+            start = b - a if b > a else 0
+            shorts.append(shorter)
+            windows.append(longer[start:start + len(shorter)])
+            owners.append(i)
+    if not windows:
+        return scores
+
+    best = {}
+    ratios = cpdist(shorts, windows, scorer=Indel.normalized_similarity, dtype=np.float64)
+    for i, ratio in zip(owners, ratios.tolist()):
+        if ratio > best.get(i, -1.0):
+            best[i] = ratio
+    for i, ratio in best.items():
+        scores[i] = 100 if ratio > .995 else int(round(100 * ratio))
+    return scores
+
+
+def medicine_uses(med):
+    return [med.get(field, "") for field in USE_FIELDS if med.get(field)]
+
+
+class _IndexSnapshot:
+    """Immutable view of the index; swapped in one assignment on rebuild."""
+
+    def __init__(self, entries):
+        # The catalogue's own medicine objects, not copies
+        self.entries = entries
+        uses_list = [medicine_uses(entry) for entry in entries]
+        # Lower-cased, joined uses per position: what relevance is scored on
+        self.all_uses = [" ".join(uses).lower() for uses in uses_list]
+        self.phrases = {}
+        self.tokens = {}
+        self.stems = {}
+        self.pairs = {}
+        # Uses too short to carry a pair are shortlisted for every symptom
+        self.always = set()
+        # Equal names share an id, for keeping one medicine per name
+        name_ids = {}
+        self.name_ids = [name_ids.setdefault(entry["name"], len(name_ids)) for entry in entries]
+        # symptom -> (positions, relevances) arrays for relevance > 20
+        self.postings = {}
+
+        for pos, (uses, all_uses) in enumerate(zip(uses_list, self.all_uses)):
+            for use in uses:
+                self.phrases.setdefault(use.lower(), set()).add(pos)
+            for token in all_uses.split():
+                self.tokens.setdefault(token, set()).add(pos)
+                self.stems.setdefault(token.rstrip("s"), set()).add(pos)
+            pairs = char_pairs(all_uses)
+            if not pairs:
+                self.always.add(pos)
+            for pair in pairs:
+                self.pairs.setdefault(pair, set()).add(pos)
+
+    def shortlist(self, symptom):
+        stem = symptom.rstrip("s")
+        if len(stem) < 2:
+            # An empty or one-letter stem is "in" almost every uses string
+            return range(len(self.entries))
+
+        positions = set(self.always)
+        positions.update(self.phrases.get(symptom, ()))
+        positions.update(self.tokens.get(symptom, ()))
+        positions.update(self.stems.get(stem, ()))
+        for pair in char_pairs(symptom):
+            positions.update(self.pairs.get(pair, ()))
+        return sorted(positions)
+
+    def row(self, symptom, relevance_fn):
+        """Cached postings of ``symptom``, scored on first use."""
+        row = self.postings.get(symptom)
+        if row is None:
+            shortlist = np.asarray(self.shortlist(symptom), dtype=np.int64)
+            all_uses = self.all_uses
+            relevances = np.asarray(
+                relevance_fn(symptom, [all_uses[pos] for pos in shortlist.tolist()]), dtype=np.float64
+            )
+            keep = relevances > 20
+            row = (shortlist[keep], relevances[keep])
+            if len(self.postings) >= MAX_CACHED_TERMS:
+                self.postings.clear()
+            self.postings[symptom] = row
+        return row
+
+
+class SymptomIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self.version = 0
+
+    @property
+    def ready(self):
+        return self._snapshot is not None
+
+    def __len__(self):
+        snapshot = self._snapshot
+        return len(snapshot.entries) if snapshot else 0
+
+    def build(self, medicines):
+        """Rebuild the index from an iterable of medicine documents.
+
+        Catalogue order is kept so ties in the final (stable) sort break
+        exactly as they did when scanning the collection.
+        """
+        # Same filter as the old find({"in_stock": True}) scan
+        entries = [med for med in medicines if med.get("in_stock") is True and medicine_uses(med)]
+
+        snapshot = _IndexSnapshot(entries)
+        with self._lock:
+            self._snapshot = snapshot
+            self.version += 1
+        return len(entries)
+
+    def rank(self, symptoms, relevance_fn, limit=5):
+        """Best ``limit`` medicines for ``symptoms`` as ``[(entry, score)]``.
+
+        A medicine's score is its mean ``relevance_fn`` over the symptoms it
+        scored ``> 20`` on. Ties keep catalogue order and only the best
+        medicine of each name is kept, as the old sort-and-dedupe scan did.
+        """
+        snapshot = self._snapshot
+        if snapshot is None or not symptoms:
+            return []
+
+        rows = [snapshot.row(symptom, relevance_fn) for symptom in symptoms]
+        positions = np.concatenate([row[0] for row in rows])
+        if not positions.size:
+            return []
+        size = len(snapshot.entries)
+        # bincount adds in input order, i.e. symptom by symptom as before
+        totals = np.bincount(positions, weights=np.concatenate([row[1] for row in rows]), minlength=size)
+        counts = np.bincount(positions, minlength=size)
+
+        candidates = np.flatnonzero(counts > 0)
+        scores = totals[candidates] / counts[candidates]
+
+        # Everything scoring at least the head-th best score is a prefix of
+        # the full stable sort; dedupe that, widening it only if names
+        # repeat too often to fill ``limit``
+        name_ids = snapshot.name_ids
+        head = HEAD_PER_RESULT * limit
+        while True:
+            if head < len(scores):
+                cutoff = -np.partition(-scores, head - 1)[head - 1]
+                selected = np.flatnonzero(scores >= cutoff)
+            else:
+                selected = np.arange(len(scores))
+            ranked = selected[np.argsort(-scores[selected], kind="stable")]
+
+            seen = set()
+            best = []
+            for i in ranked.tolist():
+                pos = int(candidates[i])
+                if name_ids[pos] not in seen:
+                    seen.add(name_ids[pos])
+                    best.append((snapshot.entries[pos], float(scores[i])))
+                    if len(best) == limit:
+                        return best
+            if len(selected) == len(scores):
+                return best
+            head *= 4
@@ -0,0 +1,162 @@
+"""
+The atomic cart updates behind ``add_item_to_cart``, without a MongoDB.
+
+mongomock stands in for the sessions collection, and a concurrent
+request's write is run just before the update it races with: the
+interleavings benchmarks/cart_concurrency.py provokes on a real server.
+Adds without a price look the medicine up, whether or not it has been
+given a ``name_key`` yet.
+
+    pip install pytest mongomock
+    python -m pytest tests
+"""
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app.py needs a MONGO_URI; as in bench_chat.py, the client is mongomock's
+import flask_pymongo  # noqa: E402
+
+os.environ["MONGO_URI"] = "mongodb://localhost:27017/cart_test"
+flask_pymongo.MongoClient = lambda *args, **kwargs: mongomock.MongoClient()
+
+import app as chatbot  # noqa: E402
+
+SESSION = "cart-test"
+NAME = "Dolo 650"
+
+
+class RacingSessions:
+    """``sessions`` collection calling ``race(collection, operator)`` before each cart update."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.race = None
+        self.updates = []
+
+    def find_one_and_update(self, filter, update, return_document=None, **kwargs):
+        operator = next(iter(update))
+        self.updates.append(operator)
+        if self.race:
+            self.race(self.collection, operator)
+        # mongomock resolves a positional "$" against {_id} only in
+        # find_one_and_update, so update by _id with the filter kept
+        doc = self.collection.find_one(filter)
+        if doc is None:
+            return None
+        self.collection.update_one(dict(filter, _id=doc["_id"]), update)
+        return self.collection.find_one({"_id": doc["_id"]})
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+def item(quantity, name=NAME):
+    return {"medicineId": "m1", "name": name, "quantity": quantity, "price": 30}
+
+
+def add(quantity=2):
+    return chatbot.add_item_to_cart(SESSION, NAME, quantity, price=30, medicine_id="m1")
+
+
+@pytest.fixture
+def db(monkeypatch):
+    # Warm-up (started at import) must not backfill the test's medicines
+    deadline = time.monotonic() + 30
+    while not chatbot.warm_up.finished_at and time.monotonic() < deadline:
+        time.sleep(0.05)
+    client = mongomock.MongoClient()
+    db = SimpleNamespace(sessions=RacingSessions(client.db.sessions), medicines=client.db.medicines)
+    monkeypatch.setattr(chatbot, "mongo", SimpleNamespace(db=db))
+    with chatbot.app.test_request_context():
+        yield db
+
+
+@pytest.fixture
+def sessions(db):
+    return db.sessions
+
+
+def test_new_session_gets_the_item(sessions):
+    cart = add()
+    assert [(i["name"], i["quantity"]) for i in cart] == [(NAME, 2)]
+    assert sessions.updates == ["$inc", "$push", "$inc", "$push"]
+
+
+def test_existing_item_is_bumped_whatever_its_case(sessions):
+    sessions.insert_one({"session_id": SESSION, "cart": [item(1, NAME.lower())]})
+    cart = add()
+    assert [(i["name"], i["quantity"]) for i in cart] == [(NAME.lower(), 3)]
+    assert sessions.updates == ["$inc"]
+
+
+def test_new_item_when_the_push_races(sessions):
+    sessions.insert_one({"session_id": SESSION, "cart": []})
+
+    def race(collection, operator):
+        # Another request adds the item between our $inc and $push
+        if operator == "$push" and not collection.find_one({"cart.name": NAME}):
+            collection.update_one({"session_id": SESSION}, {"$push": {"cart": item(1)}})
+    sessions.race = race
+
+    cart = add()
+    assert [(i["name"], i["quantity"]) for i in cart] == [(NAME, 3)]
+    assert sessions.updates == ["$inc", "$push", "$inc"]
+
+
+def test_existing_item_when_the_inc_is_missed(sessions):
+    sessions.insert_one({"session_id": SESSION, "cart": [item(1)]})
+
+    def race(collection, operator):
+        # Another request removes the item just before our $inc
+        if operator == "$inc":
+            collection.update_one({"session_id": SESSION}, {"$pull": {"cart": {"name": NAME}}})
+    sessions.race = race
+
+    cart = add()
+    assert [(i["name"], i["quantity"]) for i in cart] == [(NAME, 2)]
+    assert sessions.updates == ["$inc", "$push"]
+
+
+def test_gives_up_after_the_retry_limit(sessions):
+    sessions.insert_one({"session_id": SESSION, "cart": []})
+
+    def race(collection, operator):
+        # Every update finds the cart just changed the other way
+        if operator == "$inc":
+            collection.update_one({"session_id": SESSION}, {"$pull": {"cart": {"name": NAME}}})
+        else:
+            collection.update_one({"session_id": SESSION}, {"$push": {"cart": item(1)}})
+    sessions.race = race
+
+    with pytest.raises(RuntimeError, match="kept conflicting"):
+        add()
+    assert sessions.updates == ["$inc", "$push"] * chatbot.CART_UPDATE_ATTEMPTS
+
+
+# Medicines loaded from dataset.json, or inserted by anything but the
+# backend model, have no name_key until the next backfill
+def unkeyed_medicine(db):
+    return db.medicines.insert_one({"name": NAME, "price": "₹30", "priceNumeric": 30, "in_stock": True}).inserted_id
+
+
+def test_price_from_the_catalogue_before_the_backfill(db):
+    medicine_id = unkeyed_medicine(db)
+    chatbot.catalogue.refresh()
+    cart = chatbot.add_item_to_cart(SESSION, NAME.lower(), 1)
+    assert [(i["price"], i["medicineId"]) for i in cart] == [(30, str(medicine_id))]
+
+
+def test_price_from_mongo_before_the_backfill(db):
+    # Added after the snapshot was taken, so only Mongo has it
+    chatbot.catalogue.refresh()
+    medicine_id = unkeyed_medicine(db)
+    cart = chatbot.add_item_to_cart(SESSION, NAME.upper(), 1)
+    assert [(i["price"], i["medicineId"]) for i in cart] == [(30, str(medicine_id))]
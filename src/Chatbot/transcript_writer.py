@@ -0,0 +1,154 @@
+"""
+Buffered writer for the ``chats`` transcript collection.
+
+In ``async`` mode turns are queued and a background thread writes them
+with ``insert_many`` every ``batch_size`` turns or ``flush_interval``
+seconds. When the queue is full the caller inserts directly instead, so
+no turn is dropped on the request path. ``sync`` mode inserts on the
+request thread.
+"""
+import atexit
+import queue
+import threading
+import time
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from background import OncePerProcess
+
+MAX_RETRIES = 3
+DUPLICATE_KEY = 11000
+
+
+class TranscriptWriter:
+    def __init__(self, collection, mode="async", batch_size=100, flush_interval=1.0,
+                 max_queue=10000):
+        self.collection = collection
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = OncePerProcess()
+        self.written = 0
+        self.flushes = 0
+        self.sync_fallbacks = 0
+        self.dropped = 0
+        self.last_error = None
+
+    def write(self, turn):
+        self.write_many([turn])
+
+    def write_many(self, turns):
+        if not turns:
+            return
+        if self.mode == "sync":
+            self._insert(turns)
+            return
+
+        self.start()
+        for i, turn in enumerate(turns):
+            try:
+                self._queue.put_nowait(turn)
+            except queue.Full:
+                # Writer can't keep up: pay the latency rather than lose turns
+                self.sync_fallbacks += 1
+                self._insert(turns[i:])
+                return
+
+    def start(self):
+        """Start the flusher once per process (fork safe)."""
+        if not self._started.claim():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="transcript-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def flush(self):
+        """Block until everything queued so far has been written."""
+        if self.mode != "sync":
+            self._queue.join()
+
+    def close(self, timeout=10):
+        """Drain the queue and stop the flusher; called at interpreter exit."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._insert(batch, retries=MAX_RETRIES)
+                for _ in batch:
+                    self._queue.task_done()
+            elif self._stop.is_set():
+                return
+
+    def _next_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=min(timeout, 0.1)))
+            except queue.Empty:
+                if self._stop.is_set():
+                    break
+        return batch
+
+    def _insert(self, turns, retries=0):
+        """Insert ``turns``; retries only re-send what is not stored yet.
+
+        The driver sets each turn's ``_id`` on the first attempt, so a
+        duplicate key error means an earlier attempt stored that turn and
+        only its acknowledgement was lost.
+        """
+        for attempt in range(retries + 1):
+            try:
+                if len(turns) == 1:
+                    self.collection().insert_one(turns[0])
+                else:
+                    self.collection().insert_many(turns, ordered=False)
+                self.written += len(turns)
+                self.flushes += 1
+                return
+            except Exception as e:
+                if isinstance(e, DuplicateKeyError):
+                    self.written += len(turns)
+                    turns = []
+                elif isinstance(e, BulkWriteError):
+                    # Unordered insert: only the turns with an error are missing
+                    failed = {
+                        error["index"] for error in e.details.get("writeErrors", [])
+                        if error.get("code") != DUPLICATE_KEY
+                    }
+                    self.written += len(turns) - len(failed)
+                    turns = [turn for i, turn in enumerate(turns) if i in failed]
+                if not turns:
+                    self.flushes += 1
+                    return
+                self.last_error = str(e)
+                if attempt == retries:
+                    if not retries:
+                        raise
+                    self.dropped += len(turns)
+                    print(f"Transcript write failed, dropped {len(turns)} turns: {e}")
+                    return
+                time.sleep(0.5 * (attempt + 1))
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "flushes": self.flushes,
+            "sync_fallbacks": self.sync_fallbacks,
+            "dropped": self.dropped,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,74 @@
+"""
+Background warm-up and readiness tracking.
+
+The warm-up steps run on a background thread, each retried with
+exponential backoff until it succeeds. Components built from the
+catalogue report what they have loaded, which /readyz exposes; /healthz
+only says the process is up.
+"""
+import threading
+import time
+
+from background import OncePerProcess
+
+
+class WarmUp:
+    """
+    ``steps`` is a list of ``(name, fn)`` run in order; ``fn`` raises to be
+    retried. ``required`` names the components that must have reported
+    ``loaded`` before the process counts as ready.
+    """
+
+    def __init__(self, steps, required, retry_initial=1, retry_max=30):
+        self.steps = steps
+        self.required = required
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self._started = OncePerProcess()
+        self._started_at = None
+        self.finished_at = None
+        self.status = {name: {"state": "pending", "attempts": 0} for name, _ in steps}
+        self.components = {name: None for name in required}
+
+    def loaded(self, component, version):
+        """Called by a component when it has (re)built from catalogue ``version``."""
+        self.components[component] = {"version": version, "loaded_at": time.time()}
+
+    def ready(self):
+        return all(self.components.get(name) for name in self.required)
+
+    def start(self):
+        """Run the steps in the background once per process (fork safe)."""
+        if not self._started.claim():
+            return
+        self._started_at = time.time()
+        self.finished_at = None
+        threading.Thread(target=self.run, name="warm-up", daemon=True).start()
+
+    def run(self):
+        for name, step in self.steps:
+            entry = self.status[name]
+            delay = self.retry_initial
+            while True:
+                entry["attempts"] += 1
+                entry["state"] = "running"
+                try:
+                    step()
+                    entry.update(state="done", error=None, finished_at=time.time())
+                    break
+                except Exception as e:
+                    entry.update(state="retrying", error=str(e))
+                    print(f"Warm-up step {name} failed (attempt {entry['attempts']}), retrying in {delay}s: {e}")
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.retry_max)
+        self.finished_at = time.time()
+
+    def stats(self):
+        started = self._started_at
+        return {
+            "ready": self.ready(),
+            "components": {name: dict(entry) if entry else None for name, entry in self.components.items()},
+            "steps": {name: dict(entry) for name, entry in self.status.items()},
+            "started_at": started,
+            "warm_up_seconds": round(self.finished_at - started, 3) if started and self.finished_at else None,
+        }